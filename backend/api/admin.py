@@ -2,9 +2,12 @@ from django import forms
 from django.contrib import admin
 from django.contrib.auth.hashers import make_password
 
-from .models import Photo, Album, UserProfile, AlbumTag, AccessLink, ClientSelection
+from .models import Photo, PhotoRendition, AvatarVariant, Job, Album, UserProfile, AlbumTag, AccessLink, ClientSelection
 
 admin.site.register(Photo)
+admin.site.register(PhotoRendition)
+admin.site.register(AvatarVariant)
+admin.site.register(Job)
 admin.site.register(Album)
 admin.site.register(UserProfile)
 admin.site.register(AlbumTag)
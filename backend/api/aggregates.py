@@ -0,0 +1,30 @@
+"""
+Stored per-album aggregates.
+
+Album.photo_count, Album.cover_photo and Album.total_bytes are kept in sync
+with the album's photos on every write (see api/signals.py for single saves
+and deletes; bulk operations call refresh_album_aggregates themselves), so
+reads never have to count or sort photos. The recompute_album_aggregates
+command repairs any drift.
+"""
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Album, Photo
+
+
+def aggregate_expressions():
+    photos = Photo.objects.filter(album=OuterRef('pk')).order_by()
+    per_album = photos.values('album')
+    return {
+        'photo_count': Coalesce(Subquery(per_album.annotate(count=Count('pk')).values('count')), 0),
+        'total_bytes': Coalesce(Subquery(per_album.annotate(total=Sum('file_size')).values('total')), 0),
+        'cover_photo': Subquery(photos.order_by('order', 'created_at', 'id').values('pk')[:1]),
+    }
+
+
+def refresh_album_aggregates(*album_ids):
+    """Recompute the aggregates of the given albums with a single UPDATE."""
+    album_ids = {album_id for album_id in album_ids if album_id is not None}
+    if album_ids:
+        Album.objects.filter(pk__in=album_ids).update(**aggregate_expressions())
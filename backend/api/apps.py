@@ -2,11 +2,13 @@ from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
     def ready(self):
         import api.signals
+        import api.tasks
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -0,0 +1,137 @@
+"""
+On-disk cache of full-album ZIP archives.
+
+Archives are named after the album and a fingerprint of its contents (photo
+ids, order, titles, file sizes and mtimes), so a cached file is never served
+for an album that has changed since it was built. Stale archives are removed when
+photos change, and the cache is kept under ALBUM_ARCHIVE_CACHE['MAX_BYTES']
+by evicting the least recently used archives.
+"""
+import glob
+import hashlib
+import os
+
+from django.conf import settings
+
+from .jobs import enqueue
+from .models import Photo
+from .zipstream import iter_zip
+
+
+def cache_dir():
+    return settings.ALBUM_ARCHIVE_CACHE['DIR']
+
+
+def album_photos(album_id):
+    return list(
+        Photo.objects.filter(album_id=album_id)
+        .order_by('order', 'created_at', 'id')
+        .only('id', 'order', 'title', 'image')
+    )
+
+
+def _arcname(photo):
+    # Stored files are named by content hash, so name entries after the
+    # photo's title (the uploaded file name) instead
+    extension = os.path.splitext(photo.image.name)[1]
+    name = os.path.basename(photo.title) or str(photo.id)
+    if not name.lower().endswith(extension.lower()):
+        name += extension
+    return f"{photo.id}_{name}"
+
+
+def archive_entries(photos):
+    """``(arcname, path)`` pairs for the photos, as used in every client download."""
+    return [(_arcname(photo), photo.image.path) for photo in photos]
+
+
+def album_fingerprint(photos):
+    digest = hashlib.sha256()
+    for photo in photos:
+        stat = os.stat(photo.image.path)
+        digest.update(f"{photo.id}:{photo.order}:{stat.st_size}:{stat.st_mtime_ns}:{photo.title}\n".encode())
+    return digest.hexdigest()[:32]
+
+
+def _archive_path(album_id, fingerprint):
+    return os.path.join(cache_dir(), f"album_{album_id}_{fingerprint}.zip")
+
+
+def get_cached_archive(album_id, photos):
+    """Path of an up-to-date cached archive for the album, or None."""
+    path = _archive_path(album_id, album_fingerprint(photos))
+    try:
+        # Bump the mtime; eviction removes the least recently used archives first
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def queue_album_archive(album_id, photos=None):
+    """
+    Queue a build of the album's archive, unless one for the same contents
+    is already queued or running.
+    """
+    photos = album_photos(album_id) if photos is None else photos
+    if photos:
+        enqueue('build_album_archive', {'album_id': album_id},
+                unique_key=f"album_archive:{album_id}:{album_fingerprint(photos)}")
+
+
+def build_album_archive(album_id):
+    """Build and cache the archive for the album's current contents."""
+    photos = album_photos(album_id)
+    if not photos:
+        return None
+
+    path = _archive_path(album_id, album_fingerprint(photos))
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir(), exist_ok=True)
+    # Build under a temporary name so readers never see a partial archive
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as archive:
+            for chunk in iter_zip(archive_entries(photos)):
+                archive.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    invalidate_album_archives(album_id, keep=path)
+    evict()
+    return path
+
+
+def invalidate_album_archives(album_id, keep=None):
+    """Delete cached archives of the album, except ``keep``."""
+    for path in glob.glob(os.path.join(cache_dir(), f"album_{album_id}_*.zip")):
+        if path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def evict(max_bytes=None):
+    """Remove least recently used archives until the cache fits in ``max_bytes``."""
+    if max_bytes is None:
+        max_bytes = settings.ALBUM_ARCHIVE_CACHE['MAX_BYTES']
+    try:
+        entries = [entry for entry in os.scandir(cache_dir()) if entry.name.endswith('.zip')]
+    except FileNotFoundError:
+        return
+
+    archives = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries)
+    total = sum(size for _, size, _ in archives)
+    for _, size, path in archives:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
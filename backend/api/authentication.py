@@ -1,5 +1,7 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from .models import ClientAccessToken
 
 class ClientAccessTokenAuthentication(BaseAuthentication):
@@ -13,7 +15,8 @@ class ClientAccessTokenAuthentication(BaseAuthentication):
             return None
 
         try:
-            access_token = ClientAccessToken.objects.select_related("access_link").get(token=token)
+            # Not select_related: tokens and links may be in different databases
+            access_token = ClientAccessToken.objects.get(token=token)
         except ClientAccessToken.DoesNotExist:
             raise AuthenticationFailed('Invalid access token')
 
@@ -21,4 +24,39 @@ class ClientAccessTokenAuthentication(BaseAuthentication):
             raise AuthenticationFailed('Token expired')
 
         # Return None for user, and the actual token object for request.auth
-        return (None, access_token)
\ No newline at end of file
+        return (None, access_token)
+
+class MediaAccessAuthentication(BaseAuthentication):
+    """
+    Accepts either an owner's JWT or a client access token from the
+    Authorization header. Tokens are never read from the query string, where
+    they would end up in access logs and Referer headers; shared links use
+    signed URLs instead.
+
+    A missing, stale or unknown token leaves the request anonymous rather
+    than failing it, so a valid signed URL still works when the browser
+    also sends an expired token.
+    """
+    def authenticate(self, request):
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return None
+        token = header[len('Bearer '):].strip()
+        if not token:
+            return None
+
+        jwt_authentication = JWTAuthentication()
+        try:
+            validated_token = jwt_authentication.get_validated_token(token)
+        except (InvalidToken, TokenError):
+            # Not a JWT, so it may be a client access token
+            access_token = ClientAccessToken.objects.filter(token=token).first()
+            if access_token is None or not access_token.is_valid():
+                return None
+            return None, access_token
+
+        try:
+            return jwt_authentication.get_user(validated_token), validated_token
+        except (InvalidToken, AuthenticationFailed):
+            # The token's user is gone or inactive
+            return None
@@ -0,0 +1,103 @@
+"""
+Avatar normalisation.
+
+Uploaded avatars are checked and decoded defensively (the pixel count is read
+from the header and capped before any decoding), oriented by their EXIF tag,
+centre-cropped to a square and stored as a few fixed sizes. User chips then
+load a few kilobytes instead of the original phone photo.
+"""
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import AvatarVariant
+
+# Edge in pixels of each square avatar variant
+AVATAR_SIZES = {
+    'small': 64,
+    'medium': 160,
+    'large': 400,
+}
+AVATAR_QUALITY = 85
+
+# Larger images are rejected before decoding; ~50 megapixels covers any phone camera
+AVATAR_MAX_PIXELS = 50_000_000
+
+
+class AvatarError(ValueError):
+    pass
+
+
+def _load(f):
+    try:
+        img = Image.open(f)
+        width, height = img.size
+        if width * height > AVATAR_MAX_PIXELS:
+            raise AvatarError('Image is too large')
+        largest = max(AVATAR_SIZES.values())
+        # Lets libjpeg decode big JPEGs at a reduced scale
+        img.draft('RGB', (largest * 2, largest * 2))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white rather than black
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.convert('RGBA').getchannel('A'))
+            return background
+        return img.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise AvatarError('Invalid image file') from e
+
+
+def validate_avatar(upload):
+    """Raise AvatarError unless ``upload`` is an image we are willing to decode."""
+    _load(upload)
+    upload.seek(0)
+
+
+def generate_avatar_variants(profile):
+    """Create or replace the square variants of the profile's current avatar."""
+    existing = {variant.size: variant for variant in profile.avatar_variants.all()}
+    if not profile.avatar:
+        for variant in existing.values():
+            variant.image.delete(save=False)
+            variant.delete()
+        return
+
+    with profile.avatar.open('rb') as f:
+        current = _load(f)
+    side = min(current.size)
+    current = ImageOps.fit(current, (side, side), Image.LANCZOS)
+
+    for size, edge in sorted(AVATAR_SIZES.items(), key=lambda item: item[1], reverse=True):
+        current.thumbnail((edge, edge), Image.LANCZOS)
+
+        buffer = BytesIO()
+        current.save(buffer, 'JPEG', quality=AVATAR_QUALITY, optimize=True)
+
+        variant = existing.get(size) or AvatarVariant(profile=profile, size=size)
+        if variant.image:
+            variant.image.delete(save=False)
+        variant.edge = current.width
+        variant.image.save(f"{profile.user_id}_{size}.jpg", ContentFile(buffer.getvalue()), save=False)
+        variant.save()
+
+
+def set_avatar(profile, upload):
+    """Validate and store a new avatar for the profile, replacing the old one and its variants."""
+    validate_avatar(upload)
+    old = profile.avatar.name if profile.avatar else None
+    profile.avatar = upload
+    profile.save()
+    if old and old != profile.avatar.name:
+        profile.avatar.storage.delete(old)
+    generate_avatar_variants(profile)
+
+
+def avatar_urls(profile, request=None):
+    # Uses profile.avatar_variants.all() so callers can prefetch it
+    urls = {}
+    for variant in profile.avatar_variants.all():
+        url = variant.image.url
+        urls[variant.size] = request.build_absolute_uri(url) if request else url
+    return urls
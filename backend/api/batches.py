@@ -0,0 +1,33 @@
+"""
+Shared plumbing for long-running management commands.
+
+Backfills walk a table by primary key in batches and save each batch before
+fetching the next, outside any enclosing transaction. An interrupted run then
+loses at most one batch, and running the command again resumes with the rows
+still to do. Commands that spread work over processes close the database
+connections before forking, since a child would otherwise inherit the
+parent's open connections and interleave its queries with the parent's on
+the same handle; every process opens its own on first use.
+"""
+from django.db import connections
+
+
+def close_connections_for_fork():
+    """Close every database connection; call it right before starting child processes."""
+    connections.close_all()
+
+
+def iter_batches(queryset, batch_size, after_id=0):
+    """
+    Yield the rows of ``queryset`` after primary key ``after_id`` as lists of
+    at most ``batch_size``, in primary key order. Each batch is fetched only
+    once the previous one has been handled, so rows saved in between are
+    seen as they are then.
+    """
+    last_id = after_id
+    while True:
+        batch = list(queryset.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].pk
+        yield batch
@@ -0,0 +1,120 @@
+"""
+EXIF metadata extraction.
+
+Image.open only parses the file header; pixel data is not decoded until it
+is accessed, so reading the metadata of a large photo costs a few kilobytes
+of I/O rather than a full decode.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from PIL import ExifTags, Image, UnidentifiedImageError
+
+# Field name -> max_length of the text columns on Photo
+TEXT_FIELDS = {'camera_make': 64, 'camera_model': 64, 'lens_model': 128}
+
+# Orientations that rotate the image by 90 degrees, swapping width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _text(value, max_length):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'ignore')
+    if not isinstance(value, str):
+        return ''
+    return value.replace('\x00', '').strip()[:max_length]
+
+
+def _number(value):
+    if isinstance(value, (tuple, list)):
+        value = value[0] if value else None
+    try:
+        number = float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return number if number == number and number >= 0 else None
+
+
+def _taken_at(value, offset):
+    try:
+        taken_at = datetime.strptime(_text(value, 19), '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+    try:
+        # OffsetTimeOriginal, e.g. '+02:00'
+        sign = -1 if offset[0] == '-' else 1
+        hours, minutes = offset[1:].split(':')
+        tz = dt_timezone(sign * timedelta(hours=int(hours), minutes=int(minutes)))
+        return taken_at.replace(tzinfo=tz)
+    except (TypeError, ValueError, IndexError):
+        # No offset recorded; cameras mostly use local time, the best we can do is our own zone
+        return timezone.make_aware(taken_at)
+
+
+def _coordinate(value, ref):
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    coordinate = degrees + minutes / 60 + seconds / 3600
+    if _text(ref, 1).upper() in ('S', 'W'):
+        coordinate = -coordinate
+    return coordinate
+
+
+def read_exif(source):
+    """
+    Metadata of the image at ``source`` (a path or file object) as a dict of
+    Photo field values. Missing or unreadable tags are left out, and so is
+    everything for files that are not images.
+    """
+    try:
+        with Image.open(source) as image:
+            size = image.size
+            exif = image.getexif()
+            details = exif.get_ifd(ExifTags.IFD.Exif)
+            gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    except FileNotFoundError:
+        raise
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        return {}
+
+    data = {}
+    orientation = exif.get(ExifTags.Base.Orientation)
+    if orientation in range(1, 9):
+        data['orientation'] = orientation
+    width, height = size
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    data['width'], data['height'] = width, height
+
+    taken_at = details.get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    if taken_at:
+        data['taken_at'] = _taken_at(taken_at, details.get(ExifTags.Base.OffsetTimeOriginal))
+
+    for field, tag, tags in (
+        ('camera_make', ExifTags.Base.Make, exif),
+        ('camera_model', ExifTags.Base.Model, exif),
+        ('lens_model', ExifTags.Base.LensModel, details),
+    ):
+        data[field] = _text(tags.get(tag), TEXT_FIELDS[field])
+
+    data['focal_length'] = _number(details.get(ExifTags.Base.FocalLength))
+    iso = _number(details.get(ExifTags.Base.ISOSpeedRatings))
+    data['iso'] = int(iso) if iso is not None else None
+
+    latitude = _coordinate(gps.get(ExifTags.GPS.GPSLatitude), gps.get(ExifTags.GPS.GPSLatitudeRef))
+    longitude = _coordinate(gps.get(ExifTags.GPS.GPSLongitude), gps.get(ExifTags.GPS.GPSLongitudeRef))
+    if latitude is not None and longitude is not None and abs(latitude) <= 90 and abs(longitude) <= 180:
+        data['latitude'], data['longitude'] = latitude, longitude
+
+    return {field: value for field, value in data.items() if value not in (None, '')}
+
+
+def apply_exif(photo, source=None):
+    """Set the photo's metadata fields from its image; returns the names of the fields set."""
+    data = read_exif(source or photo.image.path)
+    for field, value in data.items():
+        setattr(photo, field, value)
+    photo.exif_extracted = True
+    return [*data, 'exif_extracted']
@@ -0,0 +1,94 @@
+"""
+Batch ingestion of uploaded photos.
+
+All files are written to storage first, then every Photo row is inserted
+with a single bulk_create inside one transaction, so a batch of hundreds of
+images costs one commit instead of one per file. bulk_create sends no
+post_save signals, so the work those handlers do for single saves (album
+aggregates, archive invalidation) is done here explicitly.
+
+Every file is checked with Pillow before anything is stored; a batch with
+any file that isn't a readable image is rejected as a whole, with the reason
+for each bad file.
+"""
+import os
+
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from .aggregates import refresh_album_aggregates
+from .archives import invalidate_album_archives
+from .exif import apply_exif
+from .jobs import enqueue_many
+from .models import Album, Photo
+from .ordering import order_after
+from .search import index_photos
+from .storage import ContentAddressedStorage
+
+
+class IngestError(Exception):
+    def __init__(self, failures):
+        super().__init__(f"{len(failures)} file(s) are not images")
+        # [{'file': name, 'error': reason}] in upload order
+        self.failures = failures
+
+
+def _verify(upload):
+    """Reason ``upload`` is not a readable image, or None; the same check Django's ImageField makes."""
+    try:
+        with Image.open(upload) as image:
+            image.verify()
+    except Exception as e:
+        # Pillow raises all sorts of errors for truncated or foreign files
+        return str(e) or type(e).__name__
+    finally:
+        upload.seek(0)
+    return None
+
+
+def _store(photo, upload):
+    photo.image.save(os.path.basename(upload.name), upload, save=False)
+    photo.sha256 = ContentAddressedStorage.content_hash(photo.image.name) or ''
+    photo.file_size = photo.image.size
+    # Header only, so cheap enough to do inline; the columns are then
+    # filterable as soon as the upload returns
+    apply_exif(photo)
+
+
+def ingest_photos(album, owner, uploads):
+    """
+    Store ``uploads`` and add them to ``album`` as new photos, ordered after
+    the album's current photos. Returns the created photos, or raises
+    IngestError without storing anything if any upload is not an image.
+    """
+    failures = []
+    for upload in uploads:
+        error = _verify(upload)
+        if error:
+            failures.append({'file': upload.name, 'error': error})
+    if failures:
+        raise IngestError(failures)
+
+    # Files stored for a batch that fails are left to gc_media: identical
+    # contents may be shared with another upload that is still in progress
+    photos = []
+    for upload in uploads:
+        photo = Photo(album=album, owner=owner, title=os.path.basename(upload.name)[:100])
+        _store(photo, upload)
+        photos.append(photo)
+
+    with transaction.atomic():
+        # Serialises concurrent batches for the same album on databases
+        # with row locks, so their order ranges do not overlap
+        Album.objects.select_for_update().filter(pk=album.pk).first()
+        last = Photo.objects.filter(album=album).aggregate(last=Max('order'))['last']
+        for photo in photos:
+            photo.order = last = order_after(last)
+
+        photos = Photo.objects.bulk_create(photos)
+        refresh_album_aggregates(album.pk)
+        index_photos([photo.pk for photo in photos])
+        enqueue_many('process_photo', [{'photo_id': photo.pk} for photo in photos])
+        transaction.on_commit(lambda: invalidate_album_archives(album.pk))
+    return photos
@@ -0,0 +1,207 @@
+"""
+Database-backed job queue.
+
+Jobs are rows in the Job table, so the queue works on SQLite without an
+external broker. Handlers are registered with the @job decorator (see
+api/tasks.py) and executed by the run_worker management command.
+
+A worker claims a job with a conditional UPDATE that moves it to ``running``
+and sets ``locked_until`` to now + the visibility timeout. If the worker dies
+mid-job, the job becomes claimable again once that timeout has passed.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+# How many candidate jobs to try per claim attempt before giving up
+CLAIM_BATCH = 10
+
+
+def queue_setting(name):
+    return settings.JOB_QUEUE[name]
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def _new_job(name, payload, max_attempts=None, delay=None):
+    if name not in _handlers:
+        raise ValueError(f"No job handler registered for '{name}'")
+    return Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts or queue_setting('MAX_ATTEMPTS'),
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+
+
+def _run_after_commit(jobs):
+    # JOB_QUEUE['EAGER'] runs jobs in-process once the surrounding transaction
+    # commits, which is handy for local development without a worker.
+    # Eager jobs are never saved; their outcome is recorded on the returned
+    # objects and a failure is logged rather than raised into the request.
+    def run():
+        for job_obj in jobs:
+            job_obj.attempts += 1
+            try:
+                _handlers[job_obj.name](**job_obj.payload)
+            except Exception:
+                job_obj.status = Job.STATUS_FAILED
+                job_obj.last_error = traceback.format_exc()
+                logger.exception("Eager job %s failed", job_obj)
+            else:
+                job_obj.status = Job.STATUS_DONE
+    transaction.on_commit(run)
+
+
+def _pending(unique_key):
+    return Job.objects.filter(unique_key=unique_key, status__in=[Job.STATUS_QUEUED, Job.STATUS_RUNNING]).first()
+
+
+def enqueue(name, payload=None, max_attempts=None, delay=None, unique_key=''):
+    """
+    Queue a job and return it. With a ``unique_key``, a job with the same key
+    that is still queued or running is returned instead of adding another.
+    """
+    job_obj = _new_job(name, payload, max_attempts, delay)
+    if queue_setting('EAGER'):
+        _run_after_commit([job_obj])
+        return job_obj
+    if not unique_key:
+        job_obj.save()
+        return job_obj
+
+    job_obj.unique_key = unique_key
+    existing = _pending(unique_key)
+    if existing is not None:
+        return existing
+    try:
+        # A savepoint, so losing the race doesn't break the caller's transaction
+        with transaction.atomic():
+            job_obj.save()
+    except IntegrityError:
+        return _pending(unique_key) or job_obj
+    return job_obj
+
+
+def enqueue_many(name, payloads, max_attempts=None):
+    """Queue one job per payload with a single INSERT."""
+    jobs = [_new_job(name, payload, max_attempts) for payload in payloads]
+    if queue_setting('EAGER'):
+        _run_after_commit(jobs)
+        return jobs
+    return Job.objects.bulk_create(jobs)
+
+
+def _claimable(now):
+    expired = Q(status=Job.STATUS_RUNNING, locked_until__lt=now)
+    return Q(status=Job.STATUS_QUEUED, run_after__lte=now) | expired
+
+
+def claim_job(worker_id, visibility_timeout):
+    """Atomically take the next runnable job, or return None if there is none."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(_claimable(now))
+        .order_by('run_after', 'id')
+        .values_list('pk', flat=True)[:CLAIM_BATCH]
+    )
+    for pk in candidates:
+        # Another worker may have claimed it since the SELECT; the filtered
+        # UPDATE only succeeds for whoever gets there first.
+        claimed = Job.objects.filter(_claimable(now), pk=pk).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job_obj, worker_id):
+    """Execute a claimed job and record the outcome."""
+    mine = Job.objects.filter(pk=job_obj.pk, locked_by=worker_id, status=Job.STATUS_RUNNING)
+
+    if job_obj.attempts > job_obj.max_attempts:
+        # Reclaimed after its last attempt timed out
+        mine.update(status=Job.STATUS_FAILED, locked_until=None, last_error='Visibility timeout expired')
+        return
+
+    try:
+        handler = _handlers.get(job_obj.name)
+        if handler is None:
+            raise LookupError(f"No job handler registered for '{job_obj.name}'")
+        handler(**job_obj.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.error("Job %s failed (attempt %s/%s)", job_obj, job_obj.attempts, job_obj.max_attempts)
+        if job_obj.attempts >= job_obj.max_attempts:
+            mine.update(status=Job.STATUS_FAILED, locked_until=None, last_error=error)
+        else:
+            backoff = queue_setting('RETRY_DELAY') * 2 ** (job_obj.attempts - 1)
+            mine.update(
+                status=Job.STATUS_QUEUED,
+                locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=backoff),
+                last_error=error,
+            )
+    else:
+        mine.update(status=Job.STATUS_DONE, locked_until=None, last_error='')
+
+
+class Worker:
+    def __init__(self, worker_id=None, visibility_timeout=None, poll_interval=None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.visibility_timeout = visibility_timeout or queue_setting('VISIBILITY_TIMEOUT')
+        self.poll_interval = poll_interval or queue_setting('POLL_INTERVAL')
+        self.running = True
+
+    def stop(self, *args):
+        # Finish the current job, then exit the loop
+        self.running = False
+
+    def run(self, burst=False):
+        """Process jobs until stopped, or until the queue is empty if ``burst``."""
+        while self.running:
+            close_old_connections()
+            job_obj = claim_job(self.worker_id, self.visibility_timeout)
+            if job_obj is None:
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            run_job(job_obj, self.worker_id)
+
+
+def worker_process(visibility_timeout=None, poll_interval=None, burst=False):
+    """Entry point for worker processes started by run_worker."""
+    import django
+    django.setup()
+
+    worker = Worker(visibility_timeout=visibility_timeout, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(burst=burst)
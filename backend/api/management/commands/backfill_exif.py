@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.batches import iter_batches
+from api.exif import apply_exif
+from api.models import Photo
+
+class Command(BaseCommand):
+    help = 'Extract EXIF metadata for photos that were uploaded before it was recorded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true', help='Re-extract photos that already have metadata')
+        parser.add_argument('--after-id', type=int, default=0, help='Resume a run after this photo id')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.all()
+        if not options['force']:
+            photos = photos.filter(exif_extracted=False)
+
+        # With --force a rerun resumes from the printed checkpoint (--after-id)
+        processed = failed = 0
+        for batch in iter_batches(photos, options['batch_size'], after_id=options['after_id']):
+            fields = {'exif_extracted'}
+            updated = []
+            for photo in batch:
+                try:
+                    fields.update(apply_exif(photo))
+                    updated.append(photo)
+                except OSError as e:
+                    failed += 1
+                    self.stderr.write(f'Photo {photo.pk}: {e}')
+
+            with transaction.atomic():
+                Photo.objects.bulk_update(updated, sorted(fields))
+            processed += len(updated)
+            self.stdout.write(f'Checkpoint: up to photo {batch[-1].pk} ({processed} done)')
+
+        self.stdout.write(self.style.SUCCESS(f'Extracted metadata for {processed} photos ({failed} failed)'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+from api.batches import iter_batches
+from api.models import Photo, PhotoRendition
+from api.renditions import RENDITION_SIZES
+from api.similarity import dhash, to_signed
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes for photos that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true', help='Recompute existing hashes')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.only('pk', 'image')
+        if not options['force']:
+            photos = photos.filter(phash__isnull=True)
+
+        # Hashing works on a 9x8 image, so the smallest rendition is as good as the original
+        smallest = min(RENDITION_SIZES, key=RENDITION_SIZES.get)
+        processed = failed = 0
+        for batch in iter_batches(photos, options['batch_size']):
+            small = dict(
+                PhotoRendition.objects.filter(photo__in=batch, size=smallest).values_list('photo_id', 'image')
+            )
+
+            updated = []
+            for photo in batch:
+                path = photo.image.storage.path(small[photo.pk]) if photo.pk in small else photo.image.path
+                try:
+                    with Image.open(path) as img:
+                        img.draft('RGB', (64, 64))
+                        photo.phash = to_signed(dhash(ImageOps.exif_transpose(img)))
+                    updated.append(photo)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Photo {photo.pk}: {e}')
+            Photo.objects.bulk_update(updated, ['phash'])
+            processed += len(updated)
+
+        self.stdout.write(self.style.SUCCESS(f'Hashed {processed} photos ({failed} failed)'))
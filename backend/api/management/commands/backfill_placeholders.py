@@ -0,0 +1,52 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from api.batches import close_connections_for_fork, iter_batches
+from api.models import Photo, PhotoRendition
+from api.renditions import RENDITION_SIZES, placeholder_from_file
+
+def _placeholder(item):
+    # Runs in the pool; works on file paths only, so no database access
+    pk, path = item
+    try:
+        return pk, placeholder_from_file(path), None
+    except Exception as e:
+        return pk, None, str(e)
+
+class Command(BaseCommand):
+    help = 'Compute inline placeholders for photos that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true', help='Recompute existing placeholders')
+
+    def _items(self, photos):
+        # The smallest rendition is much cheaper to decode than the original
+        smallest = min(RENDITION_SIZES, key=RENDITION_SIZES.get)
+        small = {
+            rendition.photo_id: rendition.image.path
+            for rendition in PhotoRendition.objects.filter(photo__in=photos, size=smallest)
+        }
+        return [(photo.pk, small.get(photo.pk) or photo.image.path) for photo in photos]
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.only('pk', 'image')
+        if not options['force']:
+            photos = photos.filter(placeholder='')
+
+        close_connections_for_fork()
+        processed = failed = 0
+        with multiprocessing.Pool(options['processes']) as pool:
+            for batch in iter_batches(photos, options['batch_size']):
+                updated = []
+                for pk, placeholder, error in pool.imap_unordered(_placeholder, self._items(batch), chunksize=16):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'Photo {pk}: {error}')
+                    else:
+                        updated.append(Photo(pk=pk, placeholder=placeholder))
+                Photo.objects.bulk_update(updated, ['placeholder'])
+                processed += len(updated)
+
+        self.stdout.write(self.style.SUCCESS(f'Computed placeholders for {processed} photos ({failed} failed)'))
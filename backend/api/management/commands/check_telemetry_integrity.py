@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import AccessLink, ClientAccessToken, ClientSelection, Photo
+
+def missing(model, ids, batch_size):
+    """The ids in ``ids`` without a ``model`` row, checked in batches."""
+    ids = sorted(ids)
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        found.update(model.objects.filter(pk__in=ids[start:start + batch_size]).values_list('pk', flat=True))
+    return set(ids) - found
+
+class Command(BaseCommand):
+    help = ('Find client tokens and selections pointing at access links or photos that no longer exist; '
+            'they are not covered by foreign key constraints (api/routers.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the orphaned rows, and expired tokens')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Each side is read from its own database; nothing here joins across them
+        link_ids = set(ClientSelection.objects.values_list('access_link_id', flat=True).distinct())
+        link_ids |= set(ClientAccessToken.objects.values_list('access_link_id', flat=True).distinct())
+        missing_links = missing(AccessLink, link_ids, batch_size)
+        missing_photos = missing(Photo, ClientSelection.objects.values_list('photo_id', flat=True).distinct(), batch_size)
+
+        orphans = [
+            ('selections of deleted access links', ClientSelection.objects.filter(access_link_id__in=missing_links)),
+            ('selections of deleted photos', ClientSelection.objects.filter(photo_id__in=missing_photos)),
+            ('tokens of deleted access links', ClientAccessToken.objects.filter(access_link_id__in=missing_links)),
+        ]
+        for label, rows in orphans:
+            count = rows.count()
+            if count and options['delete']:
+                rows.delete()
+                self.stdout.write(f'Deleted {count} {label}')
+            elif count:
+                self.stdout.write(self.style.WARNING(f'{count} {label}'))
+
+        if options['delete']:
+            expired, _ = ClientAccessToken.objects.filter(expires_at__lt=timezone.now()).delete()
+            self.stdout.write(f'Deleted {expired} expired tokens')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from api.uploads import cleanup_sessions
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked upload sessions and their part files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, help='Hours of inactivity before a session is removed '
+                                                        '(default: UPLOAD_SESSIONS["EXPIRE_AFTER"])')
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['max_age']) if options['max_age'] else None
+        removed = cleanup_sessions(max_age)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} upload sessions'))
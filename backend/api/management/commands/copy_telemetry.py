@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from api.batches import iter_batches
+from api.models import ClientAccessToken, ClientSelection, LoginAttempt
+from api.routers import telemetry_db
+
+class Command(BaseCommand):
+    help = ('Copy login attempts, client tokens and client selections from the default database into '
+            'the telemetry database after it has been configured (TELEMETRY_SQLITE_PATH)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        target = telemetry_db()
+        if target == DEFAULT_DB_ALIAS:
+            raise CommandError('No telemetry database is configured')
+
+        existing = connections[DEFAULT_DB_ALIAS].introspection.table_names()
+        for model in (LoginAttempt, ClientAccessToken, ClientSelection):
+            if model._meta.db_table not in existing:
+                self.stdout.write(f'{model.__name__}: no table in the default database')
+                continue
+
+            copied = 0
+            for batch in iter_batches(model.objects.using(DEFAULT_DB_ALIAS), options['batch_size']):
+                # Keeps ids, so running again only adds what is missing
+                with transaction.atomic(using=target):
+                    model.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+                copied += len(batch)
+            self.stdout.write(f'{model.__name__}: {copied} rows copied or already present')
+
+        self.stdout.write(self.style.SUCCESS(
+            'Done. The old tables in the default database are no longer used and can be dropped.'
+        ))
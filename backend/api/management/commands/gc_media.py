@@ -0,0 +1,79 @@
+import itertools
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.media import referenced_media
+
+def iter_files(root):
+    """Yield a DirEntry for every file below ``root``, one directory listing at a time."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            # Removed while we were walking
+            continue
+
+class Command(BaseCommand):
+    help = 'Delete files under MEDIA_ROOT that no database row refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report orphaned files')
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Hours since a file was last modified before it may be removed')
+        # Stays below SQLite's limit on query parameters
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(settings.MEDIA_ROOT)
+        cutoff = time.time() - options['min_age'] * 3600
+        # Young files may belong to an upload whose row isn't committed yet
+        files = (entry for entry in iter_files(root) if entry.stat().st_mtime < cutoff)
+
+        scanned = orphaned = freed = 0
+        while True:
+            batch = {
+                os.path.relpath(entry.path, root).replace(os.sep, '/'): entry
+                for entry in itertools.islice(files, options['batch_size'])
+            }
+            if not batch:
+                break
+            scanned += len(batch)
+
+            orphans = set(batch) - referenced_media(batch)
+            if orphans and not options['dry_run']:
+                # Check again right before deleting, in case a new row has
+                # started using one of them (identical uploads share a file)
+                orphans -= referenced_media(orphans)
+
+            for name in sorted(orphans):
+                size = batch[name].stat().st_size
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    try:
+                        # An upload reusing the file since the scan touches it
+                        # (ContentAddressedStorage) before its row commits
+                        if os.stat(batch[name].path).st_mtime >= cutoff:
+                            continue
+                        os.remove(batch[name].path)
+                    except FileNotFoundError:
+                        continue
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Removed {name}')
+                orphaned += 1
+                freed += size
+
+        action = 'Found' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} files. {action} {orphaned} orphaned files ({freed / 1024 ** 2:.1f} MB)'
+        ))
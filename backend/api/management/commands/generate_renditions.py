@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from api.models import Photo
+from api.renditions import generate_renditions, RENDITION_SIZES
+
+class Command(BaseCommand):
+    help = 'Generate thumb/grid/preview/large renditions for existing photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--album', type=int, help='Only process photos in this album')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.order_by('pk')
+        if options['album']:
+            photos = photos.filter(album_id=options['album'])
+        if not options['force']:
+            # Skip photos that already have every rendition size
+            complete = (
+                Photo.objects.filter(renditions__size__in=RENDITION_SIZES)
+                .annotate(rendition_count=Count('renditions'))
+                .filter(rendition_count=len(RENDITION_SIZES))
+                .values('pk')
+            )
+            photos = photos.exclude(pk__in=complete)
+
+        processed = failed = 0
+        for photo in photos.iterator(chunk_size=200):
+            try:
+                generate_renditions(photo)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Photo {photo.pk}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {processed} photos ({failed} failed)'))
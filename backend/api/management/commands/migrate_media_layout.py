@@ -0,0 +1,91 @@
+import hashlib
+import os
+import posixpath
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.batches import iter_batches
+from api.models import Photo
+from api.storage import ContentAddressedStorage, photo_upload_to
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def place(source, target):
+    """Make ``target`` a copy of ``source`` without ever exposing a partial file."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        # A hard link is instant and keeps the mtime, so ETags and cached
+        # album archives stay valid
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        tmp = f"{target}.{os.getpid()}.tmp"
+        shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+
+class Command(BaseCommand):
+    help = 'Move photo originals into the layout configured by MEDIA_LAYOUT, while the site is running'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved')
+
+    def handle(self, *args, **options):
+        storage = Photo._meta.get_field('image').storage
+        moved = skipped = missing = 0
+        photos = Photo.objects.only('pk', 'owner_id', 'image', 'sha256')
+        for batch in iter_batches(photos, options['batch_size']):
+            # Files are copied into place first; rows are then switched over in
+            # one transaction. Until it commits, the old names keep working.
+            changes = []
+            for photo in batch:
+                old = photo.image.name
+                try:
+                    sha256 = photo.sha256 or file_digest(storage.path(old))
+                except FileNotFoundError:
+                    missing += 1
+                    self.stderr.write(f'Photo {photo.pk}: {old} does not exist')
+                    continue
+                directory = posixpath.dirname(photo_upload_to(photo, 'x'))
+                new = ContentAddressedStorage.hashed_name(directory, sha256, os.path.splitext(old)[1])
+                if new == old:
+                    skipped += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f'{old} -> {new}')
+                else:
+                    place(storage.path(old), storage.path(new))
+                changes.append((photo.pk, old, new, sha256))
+
+            if options['dry_run']:
+                moved += len(changes)
+                continue
+
+            with transaction.atomic():
+                for pk, old, new, sha256 in changes:
+                    # Matching on the old name skips photos changed meanwhile
+                    moved += Photo.objects.filter(pk=pk, image=old).update(
+                        image=new, sha256=sha256, file_size=os.path.getsize(storage.path(new))
+                    )
+
+            # Only after the commit can nothing point at the old files any more;
+            # identical photos may still share one, so check first
+            old_names = {old for _, old, _, _ in changes}
+            still_used = set(Photo.objects.filter(image__in=old_names).values_list('image', flat=True))
+            for name in old_names - still_used:
+                storage.delete(name)
+
+            # A rerun skips photos already in place
+            self.stdout.write(f'Checkpoint: up to photo {batch[-1].pk} ({moved} moved)')
+
+        action = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {moved} photos ({skipped} already in place, {missing} missing)'
+        ))
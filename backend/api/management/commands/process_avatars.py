@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from api.avatars import AVATAR_SIZES, AvatarError, generate_avatar_variants
+from api.models import UserProfile
+
+class Command(BaseCommand):
+    help = 'Generate square avatar variants for existing avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True).order_by('pk')
+        if not options['force']:
+            profiles = profiles.annotate(variant_count=Count('avatar_variants')).exclude(variant_count=len(AVATAR_SIZES))
+
+        processed = failed = 0
+        for profile in profiles.prefetch_related('avatar_variants').iterator(chunk_size=200):
+            try:
+                generate_avatar_variants(profile)
+                processed += 1
+            except (AvatarError, OSError) as e:
+                failed += 1
+                self.stderr.write(f'Profile {profile.pk}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Processed avatars for {processed} users ({failed} failed)'))
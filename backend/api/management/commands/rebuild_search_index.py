@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.search import enabled, rebuild_index
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search index of albums, photos and tags'
+
+    def handle(self, *args, **options):
+        if not enabled():
+            raise CommandError('Full-text search needs SQLite with FTS5')
+        # Searches keep seeing the old index until the new one commits
+        with transaction.atomic():
+            counts = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed ' + ', '.join(f'{count} {name}s' for name, count in counts.items())
+        ))
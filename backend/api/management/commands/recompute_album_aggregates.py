@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from api.aggregates import aggregate_expressions
+from api.batches import iter_batches
+from api.models import Album
+
+class Command(BaseCommand):
+    help = 'Recompute stored album aggregates (photo count, cover photo, total bytes) from the photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--album', type=int, help='Only recompute this album')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        albums = Album.objects.only('pk')
+        if options['album']:
+            albums = albums.filter(pk=options['album'])
+
+        expected = aggregate_expressions()
+        checked = repaired = 0
+        for batch in iter_batches(albums, options['batch_size']):
+            ids = [album.pk for album in batch]
+            checked += len(ids)
+
+            # Report drift before fixing it; one UPDATE per batch either way
+            drifted = (
+                Album.objects.filter(pk__in=ids).annotate(**{f'expected_{name}': value for name, value in expected.items()})
+                .exclude(
+                    Q(photo_count=F('expected_photo_count'))
+                    & Q(total_bytes=F('expected_total_bytes'))
+                    & (Q(cover_photo=F('expected_cover_photo')) | Q(cover_photo__isnull=True, expected_cover_photo__isnull=True))
+                )
+                .values_list('pk', flat=True)
+            )
+            drifted = list(drifted)
+            if drifted:
+                Album.objects.filter(pk__in=drifted).update(**expected)
+                repaired += len(drifted)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Repaired albums {drifted}')
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} albums, repaired {repaired}'))
@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.batches import close_connections_for_fork
+from api.jobs import worker_process
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_QUEUE['PROCESSES'],
+                            help='Number of worker processes')
+        parser.add_argument('--visibility-timeout', type=int, default=settings.JOB_QUEUE['VISIBILITY_TIMEOUT'],
+                            help='Seconds before a job held by an unresponsive worker may be retried')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_QUEUE['POLL_INTERVAL'],
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker_options = {
+            'visibility_timeout': options['visibility_timeout'],
+            'poll_interval': options['poll_interval'],
+            'burst': options['burst'],
+        }
+
+        if options['processes'] <= 1:
+            self.stdout.write('Starting worker')
+            worker_process(**worker_options)
+            return
+
+        close_connections_for_fork()
+        processes = [
+            multiprocessing.Process(target=worker_process, kwargs=worker_options, daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} worker processes')
+
+        def shutdown(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from api.batches import close_connections_for_fork
+
+ALIAS = 'stress'
+
+def _use_scratch_database(path, deferred):
+    """Register the default database's configuration, pointed at ``path``, as the ALIAS connection."""
+    database = {**settings.DATABASES['default'], 'NAME': path}
+    database['OPTIONS'] = dict(database.get('OPTIONS', {}))
+    if deferred:
+        database['OPTIONS'].pop('transaction_mode', None)
+    connections.settings[ALIAS] = connections.configure_settings({DEFAULT_DB_ALIAS: {}, ALIAS: database})[ALIAS]
+
+def _writer(args):
+    # Runs in its own process with its own connection
+    path, deferred, iterations = args
+    _use_scratch_database(path, deferred)
+    errors = []
+    for _ in range(iterations):
+        try:
+            # Read, then write in the same transaction: the pattern of most
+            # writes in the app (get_or_create, counters, job claims)
+            with transaction.atomic(using=ALIAS), connections[ALIAS].cursor() as cursor:
+                cursor.execute('SELECT value FROM stress_counter WHERE id = 1')
+                value = cursor.fetchone()[0]
+                cursor.execute('UPDATE stress_counter SET value = %s WHERE id = 1', [value + 1])
+                cursor.execute('INSERT INTO stress_log (pid) VALUES (%s)', [os.getpid()])
+        except OperationalError as e:
+            errors.append(str(e))
+    connections[ALIAS].close()
+    return errors
+
+class Command(BaseCommand):
+    help = 'Run concurrent writer processes against a scratch copy of the SQLite configuration and report lock errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=200, help='Write transactions per process')
+        parser.add_argument('--deferred', action='store_true', help='Use plain BEGIN instead of the configured transaction mode, for comparison')
+
+    def handle(self, *args, **options):
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The default database is not SQLite')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stress.sqlite3')
+            _use_scratch_database(path, options['deferred'])
+            with connections[ALIAS].cursor() as cursor:
+                cursor.execute('CREATE TABLE stress_counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+                cursor.execute('CREATE TABLE stress_log (id INTEGER PRIMARY KEY, pid INTEGER NOT NULL)')
+                cursor.execute('INSERT INTO stress_counter (id, value) VALUES (1, 0)')
+
+            close_connections_for_fork()
+            started = time.monotonic()
+            work = [(path, options['deferred'], options['iterations'])] * options['processes']
+            with multiprocessing.Pool(options['processes']) as pool:
+                errors = [error for result in pool.map(_writer, work) for error in result]
+            elapsed = time.monotonic() - started
+
+            with connections[ALIAS].cursor() as cursor:
+                cursor.execute('SELECT value FROM stress_counter WHERE id = 1')
+                counter = cursor.fetchone()[0]
+                cursor.execute('SELECT COUNT(*) FROM stress_log')
+                rows = cursor.fetchone()[0]
+            connections[ALIAS].close()
+
+        attempted = options['processes'] * options['iterations']
+        self.stdout.write(
+            f'{attempted} transactions from {options["processes"]} processes in {elapsed:.1f}s: '
+            f'{rows} committed, {len(errors)} failed'
+        )
+        for message in sorted(set(errors)):
+            self.stderr.write(f'  {errors.count(message)} x {message}')
+        # Lost updates would show as a counter behind the number of commits
+        if errors or counter != rows or rows != attempted:
+            raise CommandError(f'Concurrent writes failed (counter {counter}, {rows} rows)')
+        self.stdout.write(self.style.SUCCESS('No lock errors or lost updates'))
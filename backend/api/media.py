@@ -0,0 +1,245 @@
+"""
+Serving of uploaded media through Django.
+
+Files are sent with ETag/Last-Modified validators, conditional GET (304)
+handling and single byte-range support, so browsers can revalidate cached
+images cheaply and interrupted downloads can resume.
+
+With FILE_SERVING['BACKEND'] set to 'x-accel-redirect' (nginx) or
+'x-sendfile' (Apache, lighttpd), Django still does the authorization and
+conditional checks but leaves sending the bytes, including ranges, to the
+front proxy.
+
+Renditions stored in several formats are negotiated: the same URL returns
+AVIF or WebP to browsers that accept them and the JPEG otherwise, with
+``Vary: Accept`` so shared caches keep the variants apart.
+
+Media URLs produced by api.storage.MediaStorage carry a signature. Plain
+<img> tags cannot send an Authorization header, so the media view accepts a
+valid signature in place of a JWT or client access token.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from urllib.parse import quote
+
+from .models import AvatarVariant, Photo, PhotoRendition, UserProfile
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def can_access_media(name, user=None, album_id=None):
+    """
+    Whether ``user`` owns something using the media file ``name``, or, for
+    clients, whether it belongs to a photo in ``album_id``. Stored photo files
+    can be shared by several photos, so any referencing photo grants access.
+    """
+    if user is not None:
+        photos = Photo.objects.filter(album__owner=user)
+    elif album_id is not None:
+        photos = Photo.objects.filter(album_id=album_id)
+    else:
+        return False
+
+    if photos.filter(image=name).exists():
+        return True
+    if PhotoRendition.objects.filter(image=name, photo__in=photos).exists():
+        return True
+    if user is None:
+        return False
+    return (
+        UserProfile.objects.filter(avatar=name, user=user).exists()
+        or AvatarVariant.objects.filter(image=name, profile__user=user).exists()
+    )
+
+
+# Every model field holding a media file name
+MEDIA_FIELDS = [
+    (Photo, 'image'),
+    (PhotoRendition, 'image'),
+    (UserProfile, 'avatar'),
+    (AvatarVariant, 'image'),
+]
+
+# Rendition files are named '<photo id>_<size>.<ext>'
+_RENDITION_PHOTO_ID_RE = re.compile(r'^(\d+)_')
+
+
+def referenced_media(names):
+    """The subset of storage ``names`` that some database row refers to."""
+    names = list(names)
+    found = set()
+    for model, field in MEDIA_FIELDS:
+        found.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+
+    # Variant names live in a JSON column that can't be matched with IN, so
+    # look them up through the renditions of the photos they were made for
+    photo_ids = set()
+    for name in set(names) - found:
+        match = _RENDITION_PHOTO_ID_RE.match(os.path.basename(name))
+        if match:
+            photo_ids.add(int(match.group(1)))
+    if photo_ids:
+        for variants in PhotoRendition.objects.filter(photo_id__in=photo_ids).values_list('variants', flat=True):
+            found.update(variants.values())
+    return found & set(names)
+
+
+def rendition_variants(name):
+    """The alternative formats of the rendition stored as ``name``, or None if it is not a rendition."""
+    return PhotoRendition.objects.filter(image=name).values_list('variants', flat=True).first()
+
+
+def negotiate_format(accept, formats):
+    """
+    The first of ``formats`` whose media type the Accept header lists
+    explicitly, or None. Wildcards don't count: a client sending only */*
+    gets the JPEG, which every client can display.
+    """
+    accepted = set()
+    for item in accept.split(','):
+        media_type, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+    for name in formats:
+        if f"image/{name}" in accepted:
+            return name
+    return None
+
+
+def _parse_range(header, size):
+    """
+    (start, end) for a single-range header, None to ignore the header, or
+    False if the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed and multi-range requests get the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _offload_response(path, content_type):
+    """Empty response telling the front proxy to send ``path``, or None to send it ourselves."""
+    backend = settings.FILE_SERVING['BACKEND']
+    if backend == 'direct':
+        return None
+
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    if backend == 'x-accel-redirect':
+        real_path = os.path.realpath(path)
+        for root, location in settings.FILE_SERVING['X_ACCEL_LOCATIONS'].items():
+            root = os.path.realpath(root)
+            if real_path.startswith(root + os.sep):
+                relative = os.path.relpath(real_path, root).replace(os.sep, '/')
+                response = HttpResponse(content_type=content_type)
+                response['X-Accel-Redirect'] = f"{location.rstrip('/')}/{quote(relative)}"
+                return response
+        # Not below any internal location nginx knows about
+        return None
+
+    raise ImproperlyConfigured(f"Unknown FILE_SERVING backend '{backend}'")
+
+
+def serve_file(request, path, filename=None, cache_control=None):
+    """
+    Response for a file on disk, honouring conditional and Range headers.
+    ``filename`` sends the file as an attachment under that name.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('File not found')
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    content_type = mimetypes.guess_type(filename or path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _offload_response(path, content_type)
+
+    if response is None:
+        byte_range = None
+        if request.META.get('HTTP_RANGE') and _if_range_matches(request, etag, last_modified):
+            byte_range = _parse_range(request.META['HTTP_RANGE'], size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(open(path, 'rb'), start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    if filename and response.status_code in (200, 206):
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control or f"private, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+    return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 18:28
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_job_photo_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='image',
+            field=models.ImageField(db_index=True, storage=api.storage.ContentAddressedStorage(), upload_to='photos/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_photo_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photorendition',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
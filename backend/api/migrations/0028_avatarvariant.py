@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_photo_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvatarVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(choices=[('small', 'Small'), ('medium', 'Medium'), ('large', 'Large')], max_length=20)),
+                ('image', models.ImageField(upload_to='avatars/variants/')),
+                ('edge', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='avatar_variants', to='api.userprofile')),
+            ],
+            options={
+                'unique_together': {('profile', 'size')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 18:40
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_avatarvariant'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photo',
+            name='image',
+            field=models.ImageField(db_index=True, storage=api.storage.ContentAddressedStorage(), upload_to=api.storage.photo_upload_to),
+        ),
+    ]
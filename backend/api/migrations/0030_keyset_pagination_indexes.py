@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 18:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_photo_image_sharded_layout'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['owner', '-created_at', 'id'], name='api_album_owner_i_68e1cf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='api_favorit_user_id_963be5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['order', 'created_at', 'id'], name='api_photo_order_2a6525_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['album', 'order', 'created_at', 'id'], name='api_photo_album_i_a5a9d1_idx'),
+        ),
+    ]
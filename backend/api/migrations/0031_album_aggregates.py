@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_album_aggregates(apps, schema_editor):
+    Album = apps.get_model('api', 'Album')
+    Photo = apps.get_model('api', 'Photo')
+    photos = Photo.objects.filter(album=OuterRef('pk')).order_by()
+    per_album = photos.values('album')
+    Album.objects.update(
+        photo_count=Coalesce(Subquery(per_album.annotate(count=Count('pk')).values('count')), 0),
+        total_bytes=Coalesce(Subquery(per_album.annotate(total=Sum('file_size')).values('total')), 0),
+        cover_photo=Subquery(photos.order_by('order', 'created_at', 'id').values('pk')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_photo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.photo'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='total_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_album_aggregates, migrations.RunPython.noop),
+    ]
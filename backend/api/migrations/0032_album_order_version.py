@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_album_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='order_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_album_order_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clientaccesstoken',
+            name='access_link',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='api.accesslink'),
+        ),
+        migrations.AlterField(
+            model_name='clientselection',
+            name='access_link',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='selections', to='api.accesslink'),
+        ),
+        migrations.AlterField(
+            model_name='clientselection',
+            name='photo',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='api.photo'),
+        ),
+    ]
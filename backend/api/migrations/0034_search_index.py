@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Frozen copy of the table and documents as api/search.py defined them when
+# this migration was written, so later model or module changes don't alter
+# what it does. Rowids are (id << 2) | kind with album 1, photo 2, tag 3.
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS api_search_index USING fts5(
+    kind UNINDEXED, object_id UNINDEXED, album_id UNINDEXED,
+    owner, title, description, tags,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+POPULATE = [
+    """INSERT INTO api_search_index (rowid, kind, object_id, album_id, owner, title, description, tags)
+       SELECT (a.id << 2) | 1, 1, a.id, a.id, 'u' || a.owner_id, a.title, COALESCE(a.description, ''),
+              COALESCE((SELECT group_concat(t.name, ' ') FROM api_album_tags at
+                        JOIN api_albumtag t ON t.id = at.albumtag_id WHERE at.album_id = a.id), '')
+       FROM api_album a""",
+    """INSERT INTO api_search_index (rowid, kind, object_id, album_id, owner, title, description, tags)
+       SELECT (p.id << 2) | 2, 2, p.id, p.album_id, 'u' || a.owner_id, p.title, p.description, ''
+       FROM api_photo p JOIN api_album a ON a.id = p.album_id""",
+    """INSERT INTO api_search_index (rowid, kind, object_id, album_id, owner, title, description, tags)
+       SELECT (t.id << 2) | 3, 3, t.id, NULL, 'u' || t.user_id, t.name, '', ''
+       FROM api_albumtag t""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; elsewhere api.search falls back to substring matching
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS api_search_index')
+    schema_editor.execute(CREATE_TABLE)
+    for sql in POPULATE:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS api_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_telemetry_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_search_index'),
+    ]
+
+    operations = [
+        # The join table's unique (album_id, albumtag_id) index serves lookups
+        # by album; filtering albums by tag needs one led by the tag
+        migrations.RunSQL(
+            'CREATE INDEX api_album_tags_tag_album ON api_album_tags (albumtag_id, album_id)',
+            'DROP INDEX api_album_tags_tag_album',
+        ),
+    ]
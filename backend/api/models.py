@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -9,22 +9,100 @@ from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
+import os
 import uuid
 
+from .storage import ContentAddressedStorage, photo_upload_to
+
 class Photo(models.Model):
+    PROCESSING_PENDING = 'pending'
+    PROCESSING_RUNNING = 'processing'
+    PROCESSING_READY = 'ready'
+    PROCESSING_FAILED = 'failed'
+    PROCESSING_CHOICES = [
+        (PROCESSING_PENDING, 'Pending'),
+        (PROCESSING_RUNNING, 'Processing'),
+        (PROCESSING_READY, 'Ready'),
+        (PROCESSING_FAILED, 'Failed'),
+    ]
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     album = models.ForeignKey('Album', on_delete=models.CASCADE, related_name='photos')
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to='photos/')
+    image = models.ImageField(upload_to=photo_upload_to, storage=ContentAddressedStorage(), db_index=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     order = models.PositiveIntegerField(default=0)
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_CHOICES, default=PROCESSING_PENDING)
+    # Tiny inline image (data URI) to paint before the renditions load
+    placeholder = models.TextField(blank=True)
+    # Perceptual hash for near-duplicate detection, see api/similarity.py
+    phash = models.BigIntegerField(null=True, blank=True)
+
+    # EXIF metadata, see api/exif.py
+    taken_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    orientation = models.PositiveSmallIntegerField(null=True, blank=True)
+    camera_make = models.CharField(max_length=64, blank=True, db_index=True)
+    camera_model = models.CharField(max_length=64, blank=True, db_index=True)
+    lens_model = models.CharField(max_length=128, blank=True, db_index=True)
+    focal_length = models.FloatField(null=True, blank=True, db_index=True)
+    iso = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    exif_extracted = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+            # Keyset pagination keys (api/pagination.py)
+            models.Index(fields=['order', 'created_at', 'id']),
+            models.Index(fields=['album', 'order', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        # Store a new upload before the row so its content hash is known.
+        # Duplicate contents are detected by the storage and not written again.
+        if self.image and not self.image._committed:
+            self.image.save(os.path.basename(self.image.name), self.image.file, save=False)
+        if self.image and not self.sha256:
+            self.sha256 = ContentAddressedStorage.content_hash(self.image.name) or ''
+            self.file_size = self.image.size
+        # The post_save handler updating the album's aggregates runs inside
+        # this transaction too
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class PhotoRendition(models.Model):
+    """Downscaled copy of a photo's original, one per size in RENDITION_SIZES"""
+    SIZE_CHOICES = [
+        ('thumb', 'Thumbnail'),
+        ('grid', 'Grid'),
+        ('preview', 'Preview'),
+        ('large', 'Large'),
+    ]
+
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='renditions')
+    size = models.CharField(max_length=20, choices=SIZE_CHOICES)
+    image = models.ImageField(upload_to='renditions/')
+    # Format ('webp', 'avif') -> storage name of the same rendition in that format
+    variants = models.JSONField(default=dict, blank=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('photo', 'size')
+
+    def __str__(self):
+        return f"{self.photo.title} ({self.size})"
     
 class AlbumTag(models.Model):
     name = models.CharField(max_length=50)
@@ -44,12 +122,35 @@ class Album(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField(AlbumTag, related_name='albums', blank=True)
 
+    # Maintained from the album's photos, see api/aggregates.py
+    photo_count = models.PositiveIntegerField(default=0)
+    cover_photo = models.ForeignKey(Photo, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total_bytes = models.BigIntegerField(default=0)
+    # Bumped by every reorder, see api/ordering.py
+    order_version = models.PositiveIntegerField(default=0)
+
+    # Only ever written by their own UPDATE statements
+    MAINTAINED_FIELDS = ('photo_count', 'cover_photo', 'total_bytes', 'order_version')
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', 'id']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Saving an album loaded before a photo was added or a reorder
+        # happened must not write back its stale counters
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name='favorited_by')
@@ -58,6 +159,9 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ['user', 'photo']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.photo.title}"
@@ -92,6 +196,26 @@ class UserProfile(models.Model):
             fail_silently=False,
         )
 
+class AvatarVariant(models.Model):
+    """Square, resized copy of a user's avatar, one per size in AVATAR_SIZES"""
+    SIZE_CHOICES = [
+        ('small', 'Small'),
+        ('medium', 'Medium'),
+        ('large', 'Large'),
+    ]
+
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='avatar_variants')
+    size = models.CharField(max_length=20, choices=SIZE_CHOICES)
+    image = models.ImageField(upload_to='avatars/variants/')
+    edge = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('profile', 'size')
+
+    def __str__(self):
+        return f"{self.profile.user.username} ({self.size})"
+
 class LoginAttempt(models.Model):
     """Track login attempts to prevent brute force attacks"""
     username = models.CharField(max_length=255)
@@ -139,9 +263,12 @@ class AccessLink(models.Model):
             return check_password(raw_password, self.password)
         return True
     
+# ClientAccessToken and ClientSelection may be stored in another database
+# than AccessLink and Photo (see api/routers.py), so their foreign keys have
+# no constraint; dependent rows are removed by api/signals.py instead.
 class ClientAccessToken(models.Model):
     token = models.CharField(max_length=100, unique=True)
-    access_link = models.ForeignKey(AccessLink, on_delete=models.CASCADE)
+    access_link = models.ForeignKey(AccessLink, on_delete=models.DO_NOTHING, db_constraint=False)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
 
@@ -149,10 +276,88 @@ class ClientAccessToken(models.Model):
         return timezone.now() < self.expires_at
     
 class ClientSelection(models.Model):
-    access_link = models.ForeignKey(AccessLink, on_delete=models.CASCADE, related_name="selections")
-    photo = models.ForeignKey("Photo", on_delete=models.CASCADE)
+    access_link = models.ForeignKey(AccessLink, on_delete=models.DO_NOTHING, db_constraint=False, related_name="selections")
+    photo = models.ForeignKey("Photo", on_delete=models.DO_NOTHING, db_constraint=False)
     selected = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ("access_link", "photo")  # one selection per photo per link
\ No newline at end of file
+        unique_together = ("access_link", "photo")  # one selection per photo per link
+
+
+class Job(models.Model):
+    """Unit of background work, claimed and run by the run_worker command"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # At most one queued or running job per non-empty key, see jobs.enqueue
+    unique_key = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['unique_key'],
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(unique_key=''),
+                name='api_job_unique_pending_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class UploadSession(models.Model):
+    """Resumable upload of one file into an album, sent as fixed-size chunks"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # optional digest of the whole file
+    photo = models.OneToOneField(Photo, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.owner.username})"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('session', 'index')
+        ordering = ['index']
@@ -0,0 +1,166 @@
+"""
+Sparse photo ordering.
+
+Photo.order values are spaced ORDER_GAP apart, so moving one photo between
+two neighbours only writes that photo: it takes the midpoint of their orders.
+When neighbours run out of room (or share an order, as older rows may) the
+album is renumbered in one bulk_update.
+
+Every reorder bumps Album.order_version with a compare-and-swap; a request
+made against an older version (e.g. from a second tab) is rejected with 409
+instead of silently undoing the other change.
+"""
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from .aggregates import refresh_album_aggregates
+from .archives import invalidate_album_archives
+from .models import Album, Photo
+
+ORDER_GAP = 1024
+
+# How photos are listed within an album; ties on order are older rows
+PHOTO_ORDERING = ('order', 'created_at', 'pk')
+
+
+class ReorderError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def order_after(last):
+    """Order for a photo appended after one ordered ``last`` (None for an empty album)."""
+    return ORDER_GAP if last is None else last + ORDER_GAP
+
+
+def append_order(album):
+    """
+    Order for one photo added at the end of ``album``. Call it inside the
+    transaction that saves the photo: the album row stays locked (on
+    databases with row locks) until then, so concurrent appends don't collide.
+    """
+    Album.objects.select_for_update().filter(pk=album.pk).first()
+    return order_after(Photo.objects.filter(album=album).aggregate(last=Max('order'))['last'])
+
+
+def _claim_version(album, version):
+    # The conditional UPDATE also takes the album's write lock, so concurrent
+    # reorders of the same album are serialised from here on
+    albums = Album.objects.filter(pk=album.pk)
+    if version is not None:
+        albums = albums.filter(order_version=version)
+    if not albums.update(order_version=F('order_version') + 1):
+        current = Album.objects.filter(pk=album.pk).values_list('order_version', flat=True).first()
+        raise ReorderError(f'The album was reordered elsewhere (now at version {current})', status=409)
+    album.refresh_from_db(fields=['order_version'])
+
+
+def _renumber(album, photo_ids):
+    """Give ``photo_ids`` (all of the album's photos, in order) evenly spaced orders."""
+    current = dict(Photo.objects.filter(album=album).values_list('pk', 'order'))
+    changed = [
+        Photo(pk=pk, order=(index + 1) * ORDER_GAP)
+        for index, pk in enumerate(photo_ids)
+        if current[pk] != (index + 1) * ORDER_GAP
+    ]
+    Photo.objects.bulk_update(changed, ['order'], batch_size=500)
+    return len(changed)
+
+
+def _adjacent(album, pk, exclude, following):
+    """
+    The photo directly after (``following``) or before photo ``pk`` in the
+    album's order, ignoring ``exclude``, as an (id, order) pair or None.
+    """
+    pivot = Photo.objects.filter(pk=pk).values('order', 'created_at', 'pk').get()
+    compare = 'gt' if following else 'lt'
+    beyond = (
+        Q(**{f'order__{compare}': pivot['order']})
+        | Q(order=pivot['order'], **{f'created_at__{compare}': pivot['created_at']})
+        | Q(order=pivot['order'], created_at=pivot['created_at'], **{f'pk__{compare}': pk})
+    )
+    ordering = PHOTO_ORDERING if following else [f'-{field}' for field in PHOTO_ORDERING]
+    return (
+        Photo.objects.filter(beyond, album=album).exclude(pk=exclude)
+        .order_by(*ordering).values_list('pk', 'order').first()
+    )
+
+
+def _reordered(album):
+    # bulk_update and update() skip the Photo signals
+    refresh_album_aggregates(album.pk)
+    transaction.on_commit(lambda: invalidate_album_archives(album.pk))
+
+
+def set_photo_order(album, photo_ids, version=None):
+    """
+    Put all of the album's photos in the order of ``photo_ids``. Returns the
+    number of rows written; photos already in the right place are not touched.
+    """
+    if len(set(photo_ids)) != len(photo_ids):
+        raise ReorderError('Duplicate photo ids')
+    with transaction.atomic():
+        _claim_version(album, version)
+        existing = set(Photo.objects.filter(album=album).values_list('pk', flat=True))
+        if set(photo_ids) != existing:
+            unknown = sorted(set(photo_ids) - existing)
+            if unknown:
+                raise ReorderError(f'Photos not in this album: {unknown}', status=404)
+            raise ReorderError(f'Missing photos: {sorted(existing - set(photo_ids))}')
+        written = _renumber(album, photo_ids)
+        _reordered(album)
+    return written
+
+
+def move_photo(album, photo_id, after=None, before=None, version=None):
+    """
+    Move a photo between its new neighbours ``after`` (the photo it follows)
+    and ``before`` (the photo it precedes). Give either or both; with only
+    ``after`` the photo goes directly after it, with only ``before`` directly
+    before it. Returns the photo's new order.
+    """
+    if after is None and before is None:
+        raise ReorderError('Give the photo to move after or before')
+    if photo_id in (after, before):
+        raise ReorderError('A photo cannot be moved next to itself')
+    if after == before:
+        raise ReorderError('The neighbours must be two different photos')
+    with transaction.atomic():
+        _claim_version(album, version)
+        neighbours = {after, before} - {None}
+        orders = dict(Photo.objects.filter(album=album, pk__in=neighbours | {photo_id}).values_list('pk', 'order'))
+        missing = (neighbours | {photo_id}) - set(orders)
+        if missing:
+            raise ReorderError(f'Photos not in this album: {sorted(missing)}', status=404)
+
+        # With one neighbour given, the other is whatever follows or precedes
+        # it now, which need not be the end of the album the client assumed
+        if before is None:
+            before, _ = _adjacent(album, after, photo_id, following=True) or (None, None)
+        elif after is None:
+            after, _ = _adjacent(album, before, photo_id, following=False) or (None, None)
+        elif (_adjacent(album, after, photo_id, following=True) or (None,))[0] != before:
+            # Photos were added or moved between them since the client loaded
+            # the album, or the two were given the wrong way round
+            raise ReorderError(f'Photo {after} is not directly followed by photo {before}', status=409)
+        orders.update(Photo.objects.filter(pk__in={after, before} - {None}).values_list('pk', 'order'))
+
+        lower = orders[after] if after is not None else -1
+        upper = orders[before] if before is not None else lower + 2 * ORDER_GAP
+        if upper - lower >= 2:
+            order = (lower + upper) // 2
+            Photo.objects.filter(pk=photo_id).update(order=order)
+        else:
+            # No integer left between the neighbours: renumber the album
+            # with the photo in its new place
+            ids = list(
+                Photo.objects.filter(album=album).exclude(pk=photo_id)
+                .order_by(*PHOTO_ORDERING).values_list('pk', flat=True)
+            )
+            position = ids.index(after) + 1 if after is not None else ids.index(before)
+            ids.insert(position, photo_id)
+            _renumber(album, ids)
+            order = (position + 1) * ORDER_GAP
+        _reordered(album)
+    return order
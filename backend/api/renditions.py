@@ -0,0 +1,116 @@
+import base64
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Photo, PhotoRendition
+from .similarity import dhash, to_signed
+
+# Longest edge in pixels for each rendition size. Renditions are never upscaled,
+# so a small original simply yields renditions at its own size.
+RENDITION_SIZES = {
+    'thumb': 320,
+    'grid': 800,
+    'preview': 1600,
+    'large': 2560,
+}
+RENDITION_QUALITY = 82
+
+# Modern encodings stored alongside each JPEG rendition, best first. The
+# media view picks one based on the request's Accept header. Formats the
+# installed Pillow cannot write (AVIF needs Pillow 11.2+ or a plugin) are skipped.
+VARIANT_FORMATS = {
+    'avif': ('AVIF', {'quality': 55}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+# Inline low-quality placeholder shown until a rendition loads. A 16px WebP
+# stays around 100-300 bytes as a data URI; the browser scales and smooths it.
+PLACEHOLDER_EDGE = 16
+PLACEHOLDER_QUALITY = 40
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _draft_size(width, height, edge):
+    scale = edge / max(width, height)
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+
+def make_placeholder(img):
+    """Data URI of a tiny, heavily compressed copy of ``img``."""
+    small = img.copy()
+    small.thumbnail((PLACEHOLDER_EDGE, PLACEHOLDER_EDGE), Image.BILINEAR)
+    buffer = BytesIO()
+    small.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def placeholder_from_file(path):
+    """Placeholder for the image at ``path``, ideally one of the photo's small renditions."""
+    with Image.open(path) as img:
+        img.draft('RGB', _draft_size(img.width, img.height, PLACEHOLDER_EDGE * 4))
+        return make_placeholder(ImageOps.exif_transpose(img).convert('RGB'))
+
+
+def variant_formats():
+    Image.init()
+    return [name for name, (pil_format, _) in VARIANT_FORMATS.items() if pil_format in Image.SAVE]
+
+
+def _save_variants(rendition, img, jpeg_size):
+    storage = rendition.image.storage
+    for name in rendition.variants.values():
+        storage.delete(name)
+
+    variants = {}
+    for name in variant_formats():
+        pil_format, options = VARIANT_FORMATS[name]
+        buffer = BytesIO()
+        img.save(buffer, pil_format, **options)
+        # Tiny renditions sometimes come out larger than the JPEG; those are not worth serving
+        if buffer.tell() >= jpeg_size:
+            continue
+        filename = rendition.image.field.generate_filename(rendition, f"{rendition.photo_id}_{rendition.size}.{name}")
+        variants[name] = storage.save(filename, ContentFile(buffer.getvalue()))
+    rendition.variants = variants
+
+
+def generate_renditions(photo):
+    """Create or replace all renditions of a photo and store its dimensions, placeholder and hash."""
+    existing = {rendition.size: rendition for rendition in photo.renditions.all()}
+    largest = max(RENDITION_SIZES.values())
+
+    with photo.image.open('rb') as f, Image.open(f) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+
+        # For JPEGs this lets libjpeg decode at 1/2, 1/4 or 1/8 scale, which is
+        # where most of the time goes on large camera originals.
+        img.draft('RGB', _draft_size(img.width, img.height, largest))
+        current = ImageOps.exif_transpose(img).convert('RGB')
+
+    # Work from the largest size down so each resize starts from the previous,
+    # already reduced, image instead of the original.
+    for size, edge in sorted(RENDITION_SIZES.items(), key=lambda item: item[1], reverse=True):
+        current.thumbnail((edge, edge), Image.LANCZOS)
+
+        buffer = BytesIO()
+        current.save(buffer, 'JPEG', quality=RENDITION_QUALITY, optimize=True, progressive=True)
+
+        rendition = existing.get(size) or PhotoRendition(photo=photo, size=size)
+        if rendition.image:
+            rendition.image.delete(save=False)
+        rendition.width, rendition.height = current.size
+        rendition.image.save(f"{photo.pk}_{size}.jpg", ContentFile(buffer.getvalue()), save=False)
+        _save_variants(rendition, current, buffer.tell())
+        rendition.save()
+
+    # current is now the smallest rendition, so these cost next to nothing
+    placeholder = make_placeholder(current)
+    phash = to_signed(dhash(current))
+    Photo.objects.filter(pk=photo.pk).update(width=width, height=height, placeholder=placeholder, phash=phash)
+    photo.width, photo.height, photo.placeholder, photo.phash = width, height, placeholder, phash
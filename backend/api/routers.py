@@ -0,0 +1,56 @@
+"""
+Database routing for high-churn rows.
+
+Login attempts, client access tokens and client selections are written on
+every login, client authentication and click. When settings.DATABASES has a
+'telemetry' entry they live in that database, so on SQLite their writes no
+longer wait for the lock that photo and album edits hold. Without one,
+everything stays in 'default'.
+
+Their foreign keys to AccessLink and Photo have no database constraint and
+do not cascade; api/signals.py removes dependent rows when links and photos
+are deleted, and `manage.py check_telemetry_integrity` finds and removes
+anything left behind. Querysets must not join across the two databases:
+load related rows with a second query instead of select_related.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+TELEMETRY_DB_ALIAS = 'telemetry'
+
+# Lowercase model names in the api app
+TELEMETRY_MODELS = {'loginattempt', 'clientaccesstoken', 'clientselection'}
+
+
+def telemetry_db():
+    """Alias of the database holding the telemetry models."""
+    return TELEMETRY_DB_ALIAS if TELEMETRY_DB_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def is_telemetry_model(model):
+    return model._meta.app_label == 'api' and model._meta.model_name in TELEMETRY_MODELS
+
+
+class TelemetryRouter:
+    def db_for_read(self, model, **hints):
+        # Explicit for every model: otherwise Django follows a relation from a
+        # telemetry row (e.g. token.access_link) into the telemetry database
+        return telemetry_db() if is_telemetry_model(model) else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Foreign keys between the two databases are resolved by id only
+        if is_telemetry_model(type(obj1)) or is_telemetry_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if telemetry_db() == DEFAULT_DB_ALIAS:
+            return None
+        if app_label == 'api' and model_name in TELEMETRY_MODELS:
+            return db == TELEMETRY_DB_ALIAS
+        # Everything else, including data migrations without a model, stays
+        # out of the telemetry database
+        return db != TELEMETRY_DB_ALIAS
@@ -0,0 +1,208 @@
+"""
+Full-text search over albums, photos and tags with SQLite FTS5.
+
+One FTS5 table holds a document per album (title, description and tag
+names), photo (title and description) and tag (name). Its rowid encodes the
+kind and id, so a document is replaced or removed through the rowid index.
+The owner is an indexed column holding a ``u<id>`` token, so scoping a
+query to one user is part of the full-text match itself rather than a
+filter over every matching row afterwards.
+
+Documents are written in the same transaction as the rows they index
+(api/signals.py, and api/ingest.py for bulk uploads); `manage.py
+rebuild_search_index` recreates them all. On databases without FTS5 the
+index is not maintained and search() falls back to substring matching.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Album, AlbumTag, Photo
+
+SEARCH_TABLE = 'api_search_index'
+
+KIND_ALBUM = 1
+KIND_PHOTO = 2
+KIND_TAG = 3
+KINDS = {'album': KIND_ALBUM, 'photo': KIND_PHOTO, 'tag': KIND_TAG}
+_KIND_BITS = 2
+
+# Relevance weight per column; matches in titles count most
+COLUMN_WEIGHTS = {
+    'kind': 0, 'object_id': 0, 'album_id': 0, 'owner': 0,
+    'title': 10.0, 'description': 2.0, 'tags': 5.0,
+}
+SNIPPET_COLUMNS = ('title', 'description', 'tags')
+MAX_QUERY_TERMS = 8
+SNIPPET_TOKENS = 12
+
+# Snippet highlight markers; replaced after the text has been HTML-escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    kind UNINDEXED, object_id UNINDEXED, album_id UNINDEXED,
+    owner, title, description, tags,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+DROP_TABLE_SQL = f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, object_id):
+    return (object_id << _KIND_BITS) | kind
+
+
+def _document_sql(kind):
+    """INSERT ... SELECT writing the documents of ``kind`` for the ids in the %s placeholder list."""
+    album, photo, tag = Album._meta.db_table, Photo._meta.db_table, AlbumTag._meta.db_table
+    album_tags = Album.tags.through._meta.db_table
+    columns = f'INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, album_id, owner, title, description, tags)'
+    if kind == KIND_ALBUM:
+        return f"""{columns}
+            SELECT (a.id << {_KIND_BITS}) | {KIND_ALBUM}, {KIND_ALBUM}, a.id, a.id, 'u' || a.owner_id,
+                   a.title, COALESCE(a.description, ''),
+                   COALESCE((SELECT group_concat(t.name, ' ') FROM {album_tags} at
+                             JOIN {tag} t ON t.id = at.albumtag_id WHERE at.album_id = a.id), '')
+            FROM {album} a WHERE a.id IN ({{ids}})"""
+    if kind == KIND_PHOTO:
+        return f"""{columns}
+            SELECT (p.id << {_KIND_BITS}) | {KIND_PHOTO}, {KIND_PHOTO}, p.id, p.album_id, 'u' || a.owner_id,
+                   p.title, p.description, ''
+            FROM {photo} p JOIN {album} a ON a.id = p.album_id WHERE p.id IN ({{ids}})"""
+    return f"""{columns}
+        SELECT (t.id << {_KIND_BITS}) | {KIND_TAG}, {KIND_TAG}, t.id, NULL, 'u' || t.user_id, t.name, '', ''
+        FROM {tag} t WHERE t.id IN ({{ids}})"""
+
+
+def _chunks(ids, size=500):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def remove_documents(kind, ids):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(ids):
+            rowids = [_rowid(kind, object_id) for object_id in chunk]
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(rowids))})", rowids)
+
+
+def index_documents(kind, ids):
+    """(Re)index the albums, photos or tags with the given ids; ids of deleted rows are removed."""
+    if not enabled():
+        return
+    remove_documents(kind, ids)
+    with connection.cursor() as cursor:
+        for chunk in _chunks(ids):
+            cursor.execute(_document_sql(kind).format(ids=', '.join(['%s'] * len(chunk))), chunk)
+
+
+def index_albums(ids):
+    index_documents(KIND_ALBUM, ids)
+
+
+def index_photos(ids):
+    index_documents(KIND_PHOTO, ids)
+
+
+def index_tags(ids):
+    index_documents(KIND_TAG, ids)
+
+
+def rebuild_index():
+    """Recreate every document. Returns the number of documents per kind."""
+    counts = {}
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_TABLE_SQL)
+        cursor.execute(CREATE_TABLE_SQL)
+        for name, kind, model in (('album', KIND_ALBUM, Album), ('photo', KIND_PHOTO, Photo), ('tag', KIND_TAG, AlbumTag)):
+            sql = _document_sql(kind).format(ids=f'SELECT id FROM {model._meta.db_table}')
+            cursor.execute(sql)
+            counts[name] = cursor.rowcount
+        # Merge the index into as few b-trees as possible
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return counts
+
+
+def query_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_QUERY_TERMS]
+
+
+def _match_expression(user, terms):
+    # All terms, the last one as a prefix since it may still be being typed,
+    # in the searchable columns only; quoting keeps FTS5 operators in the
+    # user's text from being interpreted
+    phrases = ' AND '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+    return f'owner : "u{user.pk}" AND {{title description tags}} : ({phrases})'
+
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search(user, text, kinds=None, limit=20):
+    """
+    Ranked ``(kind name, object id, album id, snippet HTML)`` tuples for the
+    user's albums, photos and tags matching every word of ``text``.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return []
+    kinds = [KINDS[name] for name in (kinds or KINDS)]
+    names = {kind: name for name, kind in KINDS.items()}
+    if not enabled():
+        return _search_without_index(user, terms, kinds, limit, names)
+
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS.values())
+    # One snippet per searchable column; the first with a match is shown
+    columns = list(COLUMN_WEIGHTS)
+    snippets = ', '.join(
+        f"snippet({SEARCH_TABLE}, {columns.index(column)}, %s, %s, '…', {SNIPPET_TOKENS})"
+        for column in SNIPPET_COLUMNS
+    )
+    sql = f"""
+        SELECT kind, object_id, album_id, {snippets}
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH %s AND kind IN ({', '.join(['%s'] * len(kinds))})
+        ORDER BY bm25({SEARCH_TABLE}, {weights})
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_MARK_START, _MARK_END] * len(SNIPPET_COLUMNS) + [_match_expression(user, terms), *kinds, limit])
+        rows = cursor.fetchall()
+
+    results = []
+    for kind, object_id, album_id, *snippets in rows:
+        snippet = next((text for text in snippets if _MARK_START in text), snippets[0])
+        results.append((names[kind], object_id, album_id, _highlight(snippet)))
+    return results
+
+
+def _search_without_index(user, terms, kinds, limit, names):
+    def matching(fields):
+        condition = Q()
+        for term in terms:
+            condition &= Q(*(Q(**{f'{field}__icontains': term}) for field in fields), _connector=Q.OR)
+        return condition
+
+    results = []
+    if KIND_ALBUM in kinds:
+        albums = Album.objects.filter(matching(['title', 'description', 'tags__name']), owner=user).distinct()
+        results += [(names[KIND_ALBUM], album.pk, album.pk, html.escape(album.title)) for album in albums[:limit]]
+    if KIND_PHOTO in kinds:
+        photos = Photo.objects.filter(matching(['title', 'description']), album__owner=user)
+        results += [(names[KIND_PHOTO], photo.pk, photo.album_id, html.escape(photo.title)) for photo in photos[:limit]]
+    if KIND_TAG in kinds:
+        tags = AlbumTag.objects.filter(matching(['name']), user=user)
+        results += [(names[KIND_TAG], tag.pk, None, html.escape(tag.name)) for tag in tags[:limit]]
+    return results[:limit]
@@ -4,6 +4,7 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from .models import Photo, Album, AlbumTag, UserProfile, LoginAttempt, AccessLink, ClientSelection
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .avatars import AvatarError, avatar_urls, set_avatar, validate_avatar as check_avatar
 from django.conf import settings
 from django.core.exceptions import ValidationError
 
@@ -75,12 +76,13 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.ImageField(source='userprofile.avatar', required=False)
+    avatar_variants = serializers.SerializerMethodField()
     email_confirmed = serializers.BooleanField(source='userprofile.email_confirmed', read_only=True)
 
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'avatar', 'email_confirmed']
+        fields = ['id', 'username', 'email', 'avatar', 'avatar_variants', 'email_confirmed']
         extra_kwargs = {
             'email': {'required': True},
             'username': {'required': True},
@@ -90,6 +92,17 @@ class UserSerializer(serializers.ModelSerializer):
     #     # Remove password validation since it's not needed for GET requests
     #     return attrs
 
+    def get_avatar_variants(self, obj):
+        profile = getattr(obj, 'userprofile', None)
+        return avatar_urls(profile, self.context.get('request')) if profile else {}
+
+    def validate_avatar(self, value):
+        try:
+            check_avatar(value)
+        except AvatarError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
     def update(self, instance, validated_data):
         userprofile_data = validated_data.pop('userprofile', {})
         # Update the user instance with the validated data
@@ -99,8 +112,7 @@ class UserSerializer(serializers.ModelSerializer):
 
         # Update avatar if provided
         if 'avatar' in userprofile_data:
-            instance.userprofile.avatar = userprofile_data['avatar']
-            instance.userprofile.save()
+            set_avatar(instance.userprofile, userprofile_data['avatar'])
 
         return instance
 
@@ -135,6 +147,48 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
 class EmailConfirmationSerializer(serializers.Serializer):
     token = serializers.UUIDField(required=True)
 
+class PhotoMoveSerializer(serializers.Serializer):
+    photo = serializers.IntegerField(min_value=1)
+    after = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    before = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+
+class PhotoOrderSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    order = serializers.IntegerField()
+
+class PhotoReorderSerializer(serializers.Serializer):
+    """
+    Either a single ``move`` or the album's full order, as ``photo_ids`` or as
+    ``photo_orders`` ([{id, order}]). ``version`` is the album's order_version
+    the client last saw.
+    """
+    version = serializers.IntegerField(min_value=0, required=False, allow_null=True, default=None)
+    move = PhotoMoveSerializer(required=False)
+    photo_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    photo_orders = PhotoOrderSerializer(many=True, required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        given = [key for key in ('move', 'photo_ids', 'photo_orders') if key in attrs]
+        if len(given) != 1:
+            raise serializers.ValidationError("Provide exactly one of move, photo_ids or photo_orders.")
+        if 'photo_orders' in attrs:
+            attrs['photo_ids'] = [item['id'] for item in sorted(attrs.pop('photo_orders'), key=lambda item: item['order'])]
+        return attrs
+
+class FavoriteBulkSerializer(serializers.Serializer):
+    MAX_PHOTOS = 500
+
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=MAX_PHOTOS)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=MAX_PHOTOS)
+
+    def validate(self, attrs):
+        add, remove = set(attrs.get('add', [])), set(attrs.get('remove', []))
+        if not add and not remove:
+            raise serializers.ValidationError("Provide photo ids to add or remove.")
+        if add & remove:
+            raise serializers.ValidationError({"remove": "Photos can't be added and removed at once."})
+        return {'add': add, 'remove': remove}
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         # Get the username or email from the request
@@ -176,11 +230,47 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         
         return data
 
+def rendition_map(photo, request=None):
+    # Uses photo.renditions.all() so callers can prefetch 'renditions'
+    renditions = {}
+    for rendition in photo.renditions.all():
+        url = rendition.image.url
+        renditions[rendition.size] = {
+            'url': request.build_absolute_uri(url) if request else url,
+            'width': rendition.width,
+            'height': rendition.height,
+            # The URL serves the best of these the browser accepts; ?image_format= picks one explicitly
+            'formats': [*rendition.variants, 'jpeg'],
+        }
+    return renditions
+
 class PhotoSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    is_favorited = serializers.SerializerMethodField()
+
     class Meta:
         model = Photo
-        fields = ['id', 'title', 'description', 'image', 'created_at']
-        read_only_fields = ['created_at']
+        fields = [
+            'id', 'title', 'description', 'image', 'width', 'height', 'placeholder', 'renditions', 'srcset', 'is_favorited', 'processing_status',
+            'created_at', 'taken_at', 'orientation', 'camera_make', 'camera_model', 'lens_model', 'focal_length', 'iso', 'latitude', 'longitude',
+        ]
+        read_only_fields = [
+            'width', 'height', 'placeholder', 'processing_status', 'created_at',
+            'taken_at', 'orientation', 'camera_make', 'camera_model', 'lens_model', 'focal_length', 'iso', 'latitude', 'longitude',
+        ]
+
+    def get_renditions(self, obj):
+        return rendition_map(obj, self.context.get('request'))
+
+    def get_srcset(self, obj):
+        # Small originals produce several renditions of the same width; list each width once
+        by_width = {r['width']: r['url'] for r in self.get_renditions(obj).values()}
+        return ', '.join(f"{url} {width}w" for width, url in sorted(by_width.items()))
+
+    def get_is_favorited(self, obj):
+        # Annotated by the views that list the user's photos (see with_favorited)
+        return getattr(obj, 'is_favorited', False)
 
 class AlbumTagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -191,8 +281,20 @@ class AlbumTagSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class AlbumTagCountSerializer(AlbumTagSerializer):
+    """Tag with the number of albums using it, from context['tag_counts'] (api/tags.py)"""
+    album_count = serializers.SerializerMethodField()
+
+    class Meta(AlbumTagSerializer.Meta):
+        fields = AlbumTagSerializer.Meta.fields + ['album_count']
+
+    def get_album_count(self, obj):
+        return self.context.get('tag_counts', {}).get(obj.pk, 0)
+
 class AlbumSerializer(serializers.ModelSerializer):
     cover_photo = serializers.SerializerMethodField()
+    cover_renditions = serializers.SerializerMethodField()
+    cover_placeholder = serializers.SerializerMethodField()
     photos = PhotoSerializer(many=True, read_only=True)
     tags = AlbumTagSerializer(many=True)
     owner = serializers.StringRelatedField()
@@ -201,15 +303,30 @@ class AlbumSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Album
-        fields = ['id', 'title', 'description', 'owner', 'cover_photo', 'photos', 'created_at', 'tags', 'client_selections', 'access_links']
-        read_only_fields = ['owner', 'created_at']
+        fields = [
+            'id', 'title', 'description', 'owner', 'cover_photo', 'cover_renditions', 'cover_placeholder', 'photos',
+            'photo_count', 'total_bytes', 'order_version', 'created_at', 'tags', 'client_selections', 'access_links',
+        ]
+        read_only_fields = ['owner', 'photo_count', 'total_bytes', 'order_version', 'created_at']
+
+    def _cover(self, obj):
+        return obj.cover_photo
 
     def get_cover_photo(self, obj):
-        # Get the first photo in the album to use as the cover photo
-        first_photo = obj.photos.first()
+        first_photo = self._cover(obj)
         if first_photo:
             return first_photo.image.url
         return None
+
+    def get_cover_renditions(self, obj):
+        first_photo = self._cover(obj)
+        if first_photo:
+            return rendition_map(first_photo, self.context.get('request'))
+        return {}
+
+    def get_cover_placeholder(self, obj):
+        first_photo = self._cover(obj)
+        return first_photo.placeholder if first_photo else ''
     
     def create(self, validated_data):
         tags_data = validated_data.pop('tags', [])
@@ -239,13 +356,55 @@ class AlbumSerializer(serializers.ModelSerializer):
         return instance
     
     def get_client_selections(self, album):
-        access_links = AccessLink.objects.filter(album=album)
-        data = {}
-        for link in access_links:
-            selections = ClientSelection.objects.filter(access_link=link).values_list('photo_id', flat=True)
-            data[link.client_name] = list(selections)
+        # One query for all links' selections rather than one per link
+        access_links = {link.pk: link for link in album.access_links.all()}
+        data = {link.client_name: [] for link in access_links.values()}
+        selections = ClientSelection.objects.filter(access_link_id__in=access_links).values_list('access_link_id', 'photo_id')
+        for link_id, photo_id in selections:
+            data[access_links[link_id].client_name].append(photo_id)
         return data
 
+class AlbumListSerializer(serializers.ModelSerializer):
+    """
+    Slim album representation for the dashboard list. Expects the queryset
+    built by AlbumViewSet for the list action (cover photo, its renditions
+    and tags loaded) and per-album selection counts in
+    context['selection_counts'], so serializing does no queries of its own.
+    """
+    cover_photo = serializers.SerializerMethodField()
+    cover_placeholder = serializers.SerializerMethodField()
+    tags = AlbumTagSerializer(many=True, read_only=True)
+    client_selections = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Album
+        fields = [
+            'id', 'title', 'description', 'created_at', 'cover_photo', 'cover_placeholder', 'photo_count', 'total_bytes',
+            'tags', 'client_selections',
+        ]
+        read_only_fields = fields
+
+    def _cover(self, obj):
+        return obj.cover_photo
+
+    def get_cover_photo(self, obj):
+        cover = self._cover(obj)
+        if cover is None:
+            return None
+        # A grid-sized rendition is plenty for a card; fall back to the original
+        for rendition in cover.renditions.all():
+            if rendition.size == 'grid':
+                return rendition.image.url
+        return cover.image.url
+
+    def get_cover_placeholder(self, obj):
+        cover = self._cover(obj)
+        return cover.placeholder if cover else ''
+
+    def get_client_selections(self, obj):
+        # Number of selected photos per client
+        return self.context.get('selection_counts', {}).get(obj.pk, {})
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         # Get the username or email from the request
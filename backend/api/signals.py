@@ -1,26 +1,140 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from .aggregates import refresh_album_aggregates
+from .archives import invalidate_album_archives, queue_album_archive
+from .models import UserProfile, Photo, Album, AlbumTag, AccessLink, ClientAccessToken, ClientSelection
+from .tags import invalidate_tag_counts
+from .search import KIND_ALBUM, KIND_PHOTO, KIND_TAG, index_albums, index_photos, index_tags, remove_documents
+from django.utils import timezone
 import uuid
-from datetime import timezone
 
 User = get_user_model()
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        profile = UserProfile.objects.create(user=instance)
-        profile.email_confirmation_token = uuid.uuid4()
-        profile.email_confirmation_sent_date = timezone.now()
-
-        try:
-            profile.send_confirmation_email()
-            print(f"Confirmation email sent to {instance.email}")
-        except Exception as e:
-            print(f"Error sending confirmation email: {str(e)}")
+        # The confirmation email itself is sent by UserRegistrationView
+        UserProfile.objects.create(
+            user=instance,
+            email_confirmation_token=uuid.uuid4(),
+            email_confirmation_sent_date=timezone.now(),
+        )
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'userprofile'):
         instance.userprofile.save()
+
+@receiver(pre_save, sender=Photo)
+def remember_previous_album(sender, instance, **kwargs):
+    # A photo moved to another album changes the aggregates of both
+    instance._previous_album_id = None
+    if instance.pk is not None:
+        instance._previous_album_id = Photo.objects.filter(pk=instance.pk).values_list('album_id', flat=True).first()
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def update_album_aggregates(sender, instance, **kwargs):
+    # Runs inside the save's or delete's transaction
+    refresh_album_aggregates(instance.album_id, getattr(instance, '_previous_album_id', None))
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_cached_archives(sender, instance, **kwargs):
+    album_id = instance.album_id
+    transaction.on_commit(lambda: invalidate_album_archives(album_id))
+
+@receiver(post_save, sender=AccessLink)
+def warm_album_archive(sender, instance, created, **kwargs):
+    # Build the archive before the client asks for it
+    if created and instance.can_download:
+        queue_album_archive(instance.album_id)
+
+# Client tokens and selections may live in the telemetry database
+# (api/routers.py), out of reach of the delete cascade. They are removed once
+# the deletion has committed; check_telemetry_integrity cleans up after a crash.
+@receiver(post_delete, sender=AccessLink)
+def delete_link_telemetry(sender, instance, **kwargs):
+    link_id = instance.pk
+
+    def delete():
+        ClientAccessToken.objects.filter(access_link_id=link_id).delete()
+        ClientSelection.objects.filter(access_link_id=link_id).delete()
+    transaction.on_commit(delete)
+
+@receiver(post_delete, sender=Photo)
+def delete_photo_selections(sender, instance, **kwargs):
+    photo_id = instance.pk
+    transaction.on_commit(lambda: ClientSelection.objects.filter(photo_id=photo_id).delete())
+
+# Search index (api/search.py); written in the same transaction as the rows
+SEARCHABLE_PHOTO_FIELDS = {'title', 'description', 'album'}
+
+@receiver(post_save, sender=Album)
+def index_album(sender, instance, **kwargs):
+    index_albums([instance.pk])
+
+@receiver(post_save, sender=Photo)
+def index_photo(sender, instance, update_fields=None, **kwargs):
+    # Processing updates don't touch the indexed text
+    if update_fields is None or SEARCHABLE_PHOTO_FIELDS & set(update_fields):
+        index_photos([instance.pk])
+
+@receiver(post_save, sender=AlbumTag)
+def index_tag(sender, instance, **kwargs):
+    index_tags([instance.pk])
+    # Albums carry their tag names
+    index_albums(instance.albums.values_list('pk', flat=True))
+
+@receiver(m2m_changed, sender=Album.tags.through)
+def index_album_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The albums losing this tag can't be looked up after the clear
+        instance._cleared_album_ids = list(instance.albums.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        index_albums([instance.pk])
+    elif action == 'post_clear':
+        index_albums(getattr(instance, '_cleared_album_ids', []))
+    else:
+        index_albums(pk_set)
+
+@receiver(pre_delete, sender=AlbumTag)
+def remember_tag_albums(sender, instance, **kwargs):
+    instance._album_ids = list(instance.albums.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=AlbumTag)
+def unindex_tag(sender, instance, **kwargs):
+    remove_documents(KIND_TAG, [instance.pk])
+    index_albums(getattr(instance, '_album_ids', []))
+
+@receiver(post_delete, sender=Album)
+def unindex_album(sender, instance, **kwargs):
+    remove_documents(KIND_ALBUM, [instance.pk])
+
+@receiver(post_delete, sender=Photo)
+def unindex_photo(sender, instance, **kwargs):
+    remove_documents(KIND_PHOTO, [instance.pk])
+
+# Cached per-user tag counts (api/tags.py); dropped once the change has
+# committed, so a concurrent request can't cache the old counts again
+def _invalidate_tag_counts_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate_tag_counts(user_id))
+
+@receiver(m2m_changed, sender=Album.tags.through)
+def album_tags_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_tag_counts_on_commit(instance.user_id if reverse else instance.owner_id)
+
+@receiver(post_save, sender=AlbumTag)
+@receiver(post_delete, sender=AlbumTag)
+def tag_changed(sender, instance, **kwargs):
+    _invalidate_tag_counts_on_commit(instance.user_id)
+
+@receiver(post_delete, sender=Album)
+def album_deleted(sender, instance, **kwargs):
+    # Its join table rows go with it, without an m2m_changed signal
+    _invalidate_tag_counts_on_commit(instance.owner_id)
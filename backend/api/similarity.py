@@ -0,0 +1,103 @@
+"""
+Near-duplicate detection with perceptual hashes.
+
+Each photo gets a 64-bit difference hash (dHash): the image is shrunk to 9x8
+greyscale pixels and every bit records whether a pixel is brighter than its
+right-hand neighbour. Resizing, recompression and small exposure changes
+flip few bits, so the Hamming distance between two hashes measures how alike
+the photos look.
+
+Finding every pair within a distance uses a BK-tree, a metric tree that
+prunes whole subtrees via the triangle inequality instead of comparing all
+n² pairs.
+"""
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(img):
+    """Unsigned 64-bit difference hash of a PIL image."""
+    pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def to_signed(value):
+    # BigIntegerField is signed; store the unsigned hash in two's complement
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    def __init__(self):
+        self._root = None
+
+    def add(self, key, item):
+        node = (key, item, {})
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, radius):
+        """``(distance, item)`` for every entry within ``radius`` of ``key``."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_key, item, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius:
+                found.append((distance, item))
+            # Only subtrees at distance d with |d - distance| <= radius can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def duplicate_clusters(hashes, radius):
+    """
+    Group ``(item, hash)`` pairs whose hashes are within ``radius`` of each
+    other, transitively. Returns the groups with more than one item, largest first.
+    """
+    tree = BKTree()
+    parent = {}
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for item, value in hashes:
+        value = to_unsigned(value)
+        parent[item] = item
+        # Matching only against what is already in the tree finds every pair once
+        for _, other in tree.search(value, radius):
+            parent[find(other)] = find(item)
+        tree.add(value, item)
+
+    clusters = {}
+    for item in parent:
+        clusters.setdefault(find(item), []).append(item)
+    return sorted((group for group in clusters.values() if len(group) > 1), key=len, reverse=True)
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import posixpath
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.utils.crypto import constant_time_compare
+from django.utils.http import urlencode
+
+_signer = signing.Signer(salt='api.media')
+
+
+def _signature(name, expires):
+    return _signer.signature(f"{name}:{expires}")
+
+
+def sign_media_url(url, name):
+    """Append an expiry and signature for ``name`` to its media URL."""
+    # Expiry is rounded up to a whole period so the URL, and therefore the
+    # browser's cache entry, stays the same for the whole period.
+    period = settings.MEDIA_URL_SIGNATURE_MAX_AGE
+    expires = (int(time.time()) // period + 2) * period
+    return f"{url}?{urlencode({'expires': expires, 'sig': _signature(name, expires)})}"
+
+
+def has_valid_signature(name, expires, signature):
+    if not expires or not signature or not expires.isdigit():
+        return False
+    if int(expires) < time.time():
+        return False
+    return constant_time_compare(signature, _signature(name, expires))
+
+
+def photo_upload_to(instance, filename):
+    """Directory for a photo's original: one per owner if MEDIA_LAYOUT['SHARD_BY_OWNER'] is set."""
+    if settings.MEDIA_LAYOUT['SHARD_BY_OWNER']:
+        return posixpath.join('photos', str(instance.owner_id), filename)
+    return posixpath.join('photos', filename)
+
+
+class MediaStorage(FileSystemStorage):
+    """Default storage for uploads; its URLs are signed for the media view."""
+
+    def url(self, name):
+        url = super().url(name)
+        if name is None:
+            return url
+        return sign_media_url(url, name)
+
+
+class ContentAddressedStorage(MediaStorage):
+    """
+    Stores every distinct file once, named after the SHA-256 of its contents.
+
+    Saving a file whose contents are already stored writes nothing and returns
+    the existing name, so the same original uploaded to several albums takes
+    disk space only once. Nothing deletes a stored file when a photo goes:
+    another upload may be reusing it in a transaction that hasn't committed
+    yet. `manage.py gc_media` removes unreferenced files once they are older
+    than its grace period, and reusing a file restarts that period.
+
+    Files are spread over MEDIA_LAYOUT['HASH_PREFIX_DEPTH'] levels of
+    directories named after leading pairs of hash digits (photos/ab/cd/abcd...),
+    which keeps every directory small.
+    """
+    _digest_re = re.compile(r'^[0-9a-f]{64}$')
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        name = self.hashed_name(posixpath.dirname(name), digest.hexdigest(), os.path.splitext(name)[1])
+        if self.exists(name):
+            # Keep gc_media away from it until the new row has committed
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+    @staticmethod
+    def hashed_name(directory, digest, extension):
+        """Storage name for contents with the given SHA-256 below ``directory``."""
+        depth = settings.MEDIA_LAYOUT['HASH_PREFIX_DEPTH']
+        prefixes = [digest[i * 2:i * 2 + 2] for i in range(depth)]
+        return posixpath.join(directory, *prefixes, f"{digest}{extension.lower()}")
+
+    @classmethod
+    def content_hash(cls, name):
+        """The SHA-256 a stored name was derived from, or None for other names."""
+        digest = os.path.splitext(posixpath.basename(name))[0]
+        return digest if cls._digest_re.match(digest) else None
@@ -0,0 +1,58 @@
+"""
+Album tag filtering and per-user tag counts.
+
+Filters are built on the Album.tags join table alone, so matching albums are
+found through its (albumtag_id, album_id) index without joining the tag or
+album tables first. Album counts per tag are cached per user and dropped
+when the user's tagging changes (api/signals.py).
+"""
+from django.core.cache import caches
+from django.db.models import Count
+
+from .models import Album, AlbumTag
+
+TAG_MODE_ANY = 'any'
+TAG_MODE_ALL = 'all'
+TAG_MODES = (TAG_MODE_ANY, TAG_MODE_ALL)
+
+TAG_COUNTS_CACHE = 'tag_counts'
+
+AlbumTags = Album.tags.through
+
+
+def _counts_key(user_id):
+    return f'album_tag_counts:{user_id}'
+
+
+def tag_counts(user):
+    """{tag id: number of albums} for all of the user's tags."""
+    cache = caches[TAG_COUNTS_CACHE]
+    key = _counts_key(user.pk)
+    counts = cache.get(key)
+    if counts is None:
+        counts = dict(
+            AlbumTag.objects.filter(user=user).annotate(album_count=Count('albums')).values_list('pk', 'album_count')
+        )
+        cache.set(key, counts)
+    return counts
+
+
+def invalidate_tag_counts(user_id):
+    caches[TAG_COUNTS_CACHE].delete(_counts_key(user_id))
+
+
+def filter_albums_by_tags(albums, user, names, mode=TAG_MODE_ANY):
+    """
+    Albums among ``albums`` tagged with any (``mode='any'``) or all
+    (``mode='all'``) of the user's tags called ``names``.
+    """
+    tag_ids = set(AlbumTag.objects.filter(user=user, name__in=names).values_list('pk', flat=True))
+    if mode == TAG_MODE_ALL and len(tag_ids) < len(set(names)):
+        # A tag the user doesn't have can't be on any album
+        return albums.none()
+
+    tagged = AlbumTags.objects.filter(albumtag_id__in=tag_ids).values('album_id')
+    if mode == TAG_MODE_ALL:
+        # The join table is unique per (album, tag), so counting rows counts tags
+        tagged = tagged.annotate(matched=Count('albumtag_id')).filter(matched=len(tag_ids))
+    return albums.filter(pk__in=tagged.values('album_id'))
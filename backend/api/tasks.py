@@ -0,0 +1,32 @@
+from .archives import build_album_archive
+from .exif import apply_exif
+from .jobs import job
+from .models import Photo
+from .renditions import generate_renditions
+
+
+@job('process_photo')
+def process_photo(photo_id):
+    """Post-upload processing for a single photo."""
+    photo = Photo.objects.filter(pk=photo_id).first()
+    if photo is None:
+        # Deleted before the worker got to it
+        return
+
+    photos = Photo.objects.filter(pk=photo_id)
+    photos.update(processing_status=Photo.PROCESSING_RUNNING)
+    try:
+        if not photo.exif_extracted:
+            # Photos created outside api.ingest
+            photo.save(update_fields=apply_exif(photo))
+        generate_renditions(photo)
+    except Exception:
+        # Left as failed unless a retry succeeds
+        photos.update(processing_status=Photo.PROCESSING_FAILED)
+        raise
+    photos.update(processing_status=Photo.PROCESSING_READY)
+
+
+@job('build_album_archive')
+def build_album_archive_job(album_id):
+    build_album_archive(album_id)
@@ -1,3 +1,1279 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import ExifTags, Image
+from PIL.TiffImagePlugin import IFDRational
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .archives import queue_album_archive
+from .avatars import AVATAR_SIZES
+from .batches import iter_batches
+from .ingest import ingest_photos
+from .jobs import enqueue, job
+from .management.commands.sqlite_stress import ALIAS as STRESS_DB_ALIAS
+from .models import AccessLink, Album, AlbumTag, ClientAccessToken, ClientSelection, Favorite, Job, LoginAttempt, Photo, UploadSession
+from .ordering import ORDER_GAP
+from .pagination import KeysetPagination
+from .renditions import RENDITION_SIZES, generate_renditions
+from .routers import TELEMETRY_DB_ALIAS, TelemetryRouter
+from .search import rebuild_index, search
+from .serializers import AlbumSerializer
+from .similarity import BKTree, duplicate_clusters, hamming, to_signed
+from .storage import ContentAddressedStorage
+from .uploads import part_path
+from .zipstream import CHUNK_SIZE, compression_for, iter_zip
+
+
+def jpeg_bytes(size=(64, 48), color=(200, 10, 10)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def jpeg_file(name='photo.jpg', **kwargs):
+    return SimpleUploadedFile(name, jpeg_bytes(**kwargs), content_type='image/jpeg')
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class MediaTestCase(TestCase):
+    """
+    Runs with media, archives and upload sessions in a temporary directory,
+    tag counts in memory and no throttling.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_dir = tempfile.mkdtemp()
+        cls._settings = override_settings(
+            MEDIA_ROOT=f'{cls._media_dir}/media/',
+            ALBUM_ARCHIVE_CACHE={**settings.ALBUM_ARCHIVE_CACHE, 'DIR': f'{cls._media_dir}/archives'},
+            UPLOAD_SESSIONS={**settings.UPLOAD_SESSIONS, 'DIR': f'{cls._media_dir}/uploads'},
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []},
+            CACHES={
+                **settings.CACHES,
+                'tag_counts': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tag-counts-tests'},
+            },
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls._media_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.album = Album.objects.create(owner=self.user, title='Smith wedding')
+
+
+class ChunkedUploadTests(MediaTestCase):
+    CHUNK_SIZE = 1024
+
+    def setUp(self):
+        super().setUp()
+        self.data = jpeg_bytes(size=(300, 200))
+        self.chunks = [self.data[i:i + self.CHUNK_SIZE] for i in range(0, len(self.data), self.CHUNK_SIZE)]
+        response = self.client.post('/api/uploads/', {
+            'album': self.album.pk, 'filename': 'photo.jpg', 'size': len(self.data), 'chunk_size': self.CHUNK_SIZE,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.session_id = response.json()['id']
+
+    def put_chunk(self, index, data, checksum=None):
+        return self.client.put(
+            f'/api/uploads/{self.session_id}/chunks/{index}/', data, content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or sha256(data),
+        )
+
+    def progress(self):
+        return self.client.get(f'/api/uploads/{self.session_id}/').json()
+
+    def test_resume_after_missing_chunks(self):
+        for index in range(0, len(self.chunks), 2):
+            self.assertEqual(self.put_chunk(index, self.chunks[index]).status_code, 200)
+        self.assertEqual(self.client.post(f'/api/uploads/{self.session_id}/complete/').status_code, 409)
+
+        received = self.progress()['received_chunks']
+        for index in set(range(len(self.chunks))) - set(received):
+            self.assertEqual(self.put_chunk(index, self.chunks[index]).status_code, 200)
+        response = self.client.post(f'/api/uploads/{self.session_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        photo = Photo.objects.get(pk=response.json()['id'])
+        with photo.image.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_corrupt_resend_keeps_accepted_chunk(self):
+        for index, chunk in enumerate(self.chunks):
+            self.put_chunk(index, chunk)
+        corrupt = b'\0' * len(self.chunks[0])
+        response = self.put_chunk(0, corrupt, checksum=sha256(self.chunks[0]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(0, self.progress()['received_chunks'])
+
+        response = self.client.post(f'/api/uploads/{self.session_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        with Photo.objects.get(pk=response.json()['id']).image.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_non_image_is_rejected_on_complete(self):
+        session = self.client.post('/api/uploads/', {'album': self.album.pk, 'filename': 'notes.jpg', 'size': 12}).json()
+        self.client.put(
+            f"/api/uploads/{session['id']}/chunks/0/", b'not an image', content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=sha256(b'not an image'),
+        )
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Photo.objects.exists())
+
+    def test_short_chunk_is_rejected(self):
+        response = self.put_chunk(0, self.chunks[0][:-1])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.progress()['received_chunks'], [])
+
+    def test_complete_rechecks_part_file(self):
+        for index, chunk in enumerate(self.chunks):
+            self.put_chunk(index, chunk)
+        # Damage the part file behind the recorded chunk hashes
+        with open(part_path(UploadSession.objects.get(pk=self.session_id)), 'r+b') as part:
+            part.seek(self.CHUNK_SIZE)
+            part.write(b'\0' * 16)
+
+        response = self.client.post(f'/api/uploads/{self.session_id}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn(1, self.progress()['received_chunks'])
+        self.assertFalse(Photo.objects.exists())
+
+
+@job('tests.fail')
+def _failing_job(message):
+    raise ValueError(message)
+
+
+class EagerJobTests(TestCase):
+    @override_settings(JOB_QUEUE={**settings.JOB_QUEUE, 'EAGER': True})
+    def test_failure_is_recorded_not_raised(self):
+        with self.assertLogs('api.jobs', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            job_obj = enqueue('tests.fail', {'message': 'broken'})
+        self.assertEqual(job_obj.status, Job.STATUS_FAILED)
+        self.assertIn('ValueError: broken', job_obj.last_error)
+        self.assertFalse(Job.objects.exists())
+
+
+class PhotoMediaTestCase(MediaTestCase):
+    """MediaTestCase with one uploaded photo and a client without credentials."""
+
+    def setUp(self):
+        super().setUp()
+        [self.photo] = ingest_photos(self.album, self.user, [jpeg_file(size=(200, 150))])
+        self.url = self.photo.image.url
+        with self.photo.image.open('rb') as f:
+            self.data = f.read()
+        self.anonymous = APIClient()
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+
+class MediaViewTests(PhotoMediaTestCase):
+    def test_signed_url_without_credentials(self):
+        response = self.anonymous.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_signed_url_with_stale_bearer_token(self):
+        response = self.anonymous.get(self.url, HTTP_AUTHORIZATION='Bearer not-a-valid-token')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsigned_url_needs_owner_token(self):
+        unsigned = self.url.split('?')[0]
+        self.assertEqual(self.anonymous.get(unsigned).status_code, 404)
+        access = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.anonymous.get(unsigned, HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 200)
+        # Tokens in the query string are ignored
+        self.assertEqual(self.anonymous.get(unsigned, {'access_token': access}).status_code, 404)
+
+    def test_range(self):
+        response = self.anonymous.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(self.content(response), self.data[10:20])
+
+        response = self.anonymous.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.content(response), self.data[-5:])
+
+    def test_unsatisfiable_range(self):
+        response = self.anonymous.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_conditional_get(self):
+        etag = self.anonymous.get(self.url)['ETag']
+        self.assertEqual(self.anonymous.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.anonymous.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.anonymous.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.data)
+
+
+class FileServingTests(PhotoMediaTestCase):
+    def offload(self, backend, locations=None):
+        if locations is None:
+            locations = {settings.MEDIA_ROOT: '/protected/media/'}
+        return override_settings(FILE_SERVING={'BACKEND': backend, 'X_ACCEL_LOCATIONS': locations})
+
+    def test_x_accel_redirect(self):
+        with self.offload('x-accel-redirect'):
+            response = self.anonymous.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/media/{self.photo.image.name}')
+        self.assertEqual(response.content, b'')
+        # Validators are still set by Django so the proxy can answer ranges and revalidation
+        self.assertIn('ETag', response)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_x_sendfile(self):
+        with self.offload('x-sendfile'):
+            response = self.anonymous.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.photo.image.path)
+        self.assertEqual(response.content, b'')
+
+    def test_not_modified_is_answered_by_django(self):
+        etag = self.anonymous.get(self.url)['ETag']
+        with self.offload('x-accel-redirect'):
+            response = self.anonymous.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    def test_unauthorized_request_is_not_offloaded(self):
+        with self.offload('x-accel-redirect'):
+            response = self.anonymous.get(self.url.split('?')[0])
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    def test_file_outside_locations_is_sent_directly(self):
+        with self.offload('x-accel-redirect', locations={}):
+            response = self.anonymous.get(self.url)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(self.content(response), self.data)
+
+
+class SharedFileTests(MediaTestCase):
+    def age(self, path, hours):
+        old = os.stat(path).st_mtime - hours * 3600
+        os.utime(path, (old, old))
+
+    def test_deleting_a_photo_leaves_the_file_to_gc_media(self):
+        [photo] = ingest_photos(self.album, self.user, [jpeg_file()])
+        path = photo.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertTrue(os.path.exists(path))
+
+        self.age(path, 48)
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertFalse(os.path.exists(path))
+
+    def test_reusing_a_file_restarts_the_grace_period(self):
+        [photo] = ingest_photos(self.album, self.user, [jpeg_file()])
+        path = photo.image.path
+        photo.delete()
+        self.age(path, 48)
+
+        [copy] = ingest_photos(self.album, self.user, [jpeg_file()])
+        self.assertEqual(copy.image.path, path)
+        copy.delete()
+        # Unreferenced again, but too recently reused to be collected
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+
+
+class PhotoOrderTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 40, 0, 0)) for i in range(4)])
+        self.ids = [photo.pk for photo in self.photos]
+
+    def listed(self):
+        return list(self.album.photos.order_by('order', 'created_at', 'id').values_list('pk', flat=True))
+
+    def reorder(self, **data):
+        return self.client.post(f'/api/albums/{self.album.pk}/reorder-photos/', data, format='json')
+
+    def test_move_with_version(self):
+        a, b, c, d = self.ids
+        response = self.reorder(move={'photo': d, 'after': a, 'before': b}, version=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 1)
+        self.assertEqual(self.listed(), [a, d, b, c])
+
+    def test_stale_version_is_rejected(self):
+        a, b, c, d = self.ids
+        self.reorder(move={'photo': d, 'after': a, 'before': b}, version=0)
+        response = self.reorder(move={'photo': a, 'after': c}, version=0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], 1)
+        self.assertEqual(self.listed(), [a, d, b, c])
+
+    def test_move_after_only_lands_before_the_real_successor(self):
+        a, b, c, d = self.ids
+        self.assertEqual(self.reorder(move={'photo': d, 'after': a}).status_code, 200)
+        self.assertEqual(self.listed(), [a, d, b, c])
+        self.assertEqual(self.reorder(move={'photo': c, 'before': d}).status_code, 200)
+        self.assertEqual(self.listed(), [a, c, d, b])
+
+    def test_neighbours_must_be_adjacent(self):
+        a, b, c, d = self.ids
+        # c lies between a and d
+        response = self.reorder(move={'photo': b, 'after': a, 'before': d}, version=0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], 0)
+        self.assertEqual(self.listed(), [a, b, c, d])
+
+    def test_reversed_neighbours_are_rejected(self):
+        a, b, c, d = self.ids
+        response = self.reorder(move={'photo': d, 'after': b, 'before': a})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.listed(), [a, b, c, d])
+
+    def test_neighbours_of_the_moved_photo_are_adjacent(self):
+        a, b, c, d = self.ids
+        # b sits between a and c; moving it there again leaves the order alone
+        self.assertEqual(self.reorder(move={'photo': b, 'after': a, 'before': c}).status_code, 200)
+        self.assertEqual(self.listed(), [a, b, c, d])
+
+    def test_move_into_exhausted_gap_renumbers(self):
+        a, b, c, d = self.ids
+        Photo.objects.filter(pk=b).update(order=Photo.objects.get(pk=a).order + 1)
+        self.assertEqual(self.reorder(move={'photo': d, 'after': a}).status_code, 200)
+        self.assertEqual(self.listed(), [a, d, b, c])
+
+    def test_created_photo_is_appended(self):
+        response = self.client.post('/api/photos/', {'album': self.album.pk, 'title': 'New', 'image': jpeg_file('new.jpg')})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.listed()[-1], response.json()['id'])
+        self.assertEqual(len(set(self.album.photos.values_list('order', flat=True))), 5)
+
+
+class TelemetryRouterTests(SimpleTestCase):
+    router = TelemetryRouter()
+
+    def test_single_database(self):
+        self.assertEqual(self.router.db_for_write(LoginAttempt), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(Photo), DEFAULT_DB_ALIAS)
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'api', 'loginattempt'))
+
+    @mock.patch('api.routers.telemetry_db', return_value=TELEMETRY_DB_ALIAS)
+    def test_telemetry_database(self, telemetry_db):
+        for model in (LoginAttempt, ClientAccessToken, ClientSelection):
+            self.assertEqual(self.router.db_for_write(model), TELEMETRY_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(model), TELEMETRY_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(AccessLink), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Photo), DEFAULT_DB_ALIAS)
+
+        self.assertTrue(self.router.allow_migrate(TELEMETRY_DB_ALIAS, 'api', 'clientselection'))
+        self.assertFalse(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'api', 'clientselection'))
+        self.assertFalse(self.router.allow_migrate(TELEMETRY_DB_ALIAS, 'api', 'photo'))
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'api', 'photo'))
+        # Data migrations without a model stay out of the telemetry database
+        self.assertFalse(self.router.allow_migrate(TELEMETRY_DB_ALIAS, 'api'))
+
+
+class TelemetryDatabaseTests(TransactionTestCase):
+    """
+    Runs against a second SQLite database registered as the telemetry alias.
+    The test runner only sets up aliases present in settings, so this one is
+    created and migrated here, and only then allowed for the tests.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.databases = {DEFAULT_DB_ALIAS, TELEMETRY_DB_ALIAS}
+        cls._directory = tempfile.mkdtemp()
+        database = {**settings.DATABASES[DEFAULT_DB_ALIAS], 'NAME': os.path.join(cls._directory, 'telemetry.sqlite3')}
+        connections.settings[TELEMETRY_DB_ALIAS] = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: {}, TELEMETRY_DB_ALIAS: database}
+        )[TELEMETRY_DB_ALIAS]
+        cls._telemetry_db = mock.patch('api.routers.telemetry_db', return_value=TELEMETRY_DB_ALIAS)
+        cls._telemetry_db.start()
+        call_command('migrate', database=TELEMETRY_DB_ALIAS, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._telemetry_db.stop()
+        connections[TELEMETRY_DB_ALIAS].close()
+        del connections[TELEMETRY_DB_ALIAS]
+        del connections.settings[TELEMETRY_DB_ALIAS]
+        shutil.rmtree(cls._directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.album = Album.objects.create(owner=user, title='Smith wedding')
+        self.link = AccessLink.objects.create(album=self.album, client_name='Smith')
+
+    def test_only_telemetry_tables_are_migrated(self):
+        tables = connections[TELEMETRY_DB_ALIAS].introspection.table_names()
+        for model in (LoginAttempt, ClientAccessToken, ClientSelection):
+            self.assertIn(model._meta.db_table, tables)
+        self.assertNotIn(Photo._meta.db_table, tables)
+        self.assertNotIn(Album._meta.db_table, tables)
+
+    def test_rows_are_written_to_the_telemetry_database(self):
+        token = ClientAccessToken.objects.create(
+            token='abc', access_link=self.link, expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.assertEqual(token._state.db, TELEMETRY_DB_ALIAS)
+        self.assertTrue(ClientAccessToken.objects.using(TELEMETRY_DB_ALIAS).filter(token='abc').exists())
+        self.assertFalse(ClientAccessToken.objects.using(DEFAULT_DB_ALIAS).exists())
+        # Relations are followed back into the default database by id
+        self.assertEqual(ClientAccessToken.objects.get(token='abc').access_link, self.link)
+
+    def test_deleting_a_link_removes_its_telemetry(self):
+        ClientAccessToken.objects.create(token='abc', access_link=self.link, expires_at=timezone.now() + timedelta(hours=1))
+        self.link.delete()
+        self.assertFalse(ClientAccessToken.objects.exists())
+
+
+class SearchTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.album.description = 'Ceremony at <St. Mary> church'
+        self.album.save()
+        self.tag = AlbumTag.objects.create(user=self.user, name='Nuptials')
+        self.album.tags.add(self.tag)
+        [self.photo] = ingest_photos(self.album, self.user, [jpeg_file('First dance.jpg')])
+
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_album = Album.objects.create(owner=other, title='Smith wedding')
+        ingest_photos(other_album, other, [jpeg_file('First dance.jpg')])
+
+    def hits(self, text, **kwargs):
+        return [(kind, object_id) for kind, object_id, _, _ in search(self.user, text, **kwargs)]
+
+    def test_scoped_to_owner(self):
+        self.assertEqual(self.hits('smith'), [('album', self.album.pk)])
+        self.assertEqual(self.hits('dance'), [('photo', self.photo.pk)])
+
+    def test_all_terms_and_last_as_prefix(self):
+        self.assertEqual(self.hits('smith cerem'), [('album', self.album.pk)])
+        self.assertEqual(self.hits('smith dance'), [])
+        self.assertEqual(self.hits('nupt'), [('tag', self.tag.pk), ('album', self.album.pk)])
+
+    def test_kinds(self):
+        self.assertEqual(self.hits('nuptials', kinds=['tag']), [('tag', self.tag.pk)])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.hits('"smith" * ^wedding('), [('album', self.album.pk)])
+        # Operator words are plain terms that must match too
+        self.assertEqual(self.hits('smith OR dance'), [])
+        self.assertEqual(self.hits('!!!'), [])
+
+    def test_snippet_is_escaped_and_marked(self):
+        [(_, _, _, snippet)] = search(self.user, 'ceremony')
+        self.assertIn('<mark>Ceremony</mark>', snippet)
+        self.assertIn('&lt;St. Mary&gt;', snippet)
+
+    def test_index_follows_changes(self):
+        self.tag.name = 'Reception'
+        self.tag.save()
+        self.assertEqual(self.hits('nuptials'), [])
+        self.assertIn(('album', self.album.pk), self.hits('reception'))
+
+        self.album.tags.remove(self.tag)
+        self.assertEqual(self.hits('reception'), [('tag', self.tag.pk)])
+
+        self.photo.title = 'Cake cutting'
+        self.photo.save(update_fields=['title'])
+        self.assertEqual(self.hits('dance'), [])
+        self.photo.delete()
+        self.assertEqual(self.hits('cake'), [])
+
+    def test_rebuild(self):
+        counts = rebuild_index()
+        self.assertEqual(counts, {'album': 2, 'photo': 2, 'tag': 1})
+        self.assertEqual(self.hits('smith'), [('album', self.album.pk)])
+
+    def test_endpoint(self):
+        response = self.client.get('/api/search/', {'q': 'smith', 'type': 'album'})
+        self.assertEqual(response.status_code, 200)
+        [result] = response.json()['results']
+        self.assertEqual((result['type'], result['id'], result['title']), ('album', self.album.pk, 'Smith wedding'))
+        self.assertEqual(self.client.get('/api/search/', {'q': 'smith', 'type': 'bogus'}).status_code, 400)
+
+
+class AlbumTagTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = Album.objects.create(owner=self.user, title='Second')
+        self.third = Album.objects.create(owner=self.user, title='Third')
+        self.wedding = AlbumTag.objects.create(user=self.user, name='wedding')
+        self.year = AlbumTag.objects.create(user=self.user, name='2024')
+        self.album.tags.add(self.wedding, self.year)
+        self.second.tags.add(self.wedding)
+        self.third.tags.add(self.year)
+
+    def titles(self, **params):
+        response = self.client.get('/api/albums/', {'paginate': 'false', **params})
+        self.assertEqual(response.status_code, 200)
+        return sorted(album['title'] for album in response.json())
+
+    def counts(self):
+        return {tag['name']: tag['album_count'] for tag in self.client.get('/api/tags/').json()}
+
+    def test_filter(self):
+        self.assertEqual(self.titles(tags='wedding,2024'), ['Second', 'Smith wedding', 'Third'])
+        self.assertEqual(self.titles(tags='wedding, 2024', tag_mode='all'), ['Smith wedding'])
+        self.assertEqual(self.titles(tags='wedding,unknown', tag_mode='all'), [])
+        self.assertEqual(self.client.get('/api/albums/', {'tags': 'wedding', 'tag_mode': 'some'}).status_code, 400)
+
+    def test_counts_follow_changes(self):
+        self.assertEqual(self.counts(), {'wedding': 2, '2024': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.third.tags.add(self.wedding)
+        self.assertEqual(self.counts(), {'wedding': 3, '2024': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wedding.albums.remove(self.album)
+        self.assertEqual(self.counts(), {'wedding': 2, '2024': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.third.delete()
+        self.assertEqual(self.counts(), {'wedding': 1, '2024': 1})
+
+
+class ArchiveQueueTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 60, 0, 0)) for i in range(2)])
+
+    def builds(self):
+        return Job.objects.filter(name='build_album_archive')
+
+    def test_one_pending_build_per_album_contents(self):
+        queue_album_archive(self.album.pk)
+        queue_album_archive(self.album.pk)
+        self.assertEqual(self.builds().count(), 1)
+
+        self.builds().update(status=Job.STATUS_RUNNING)
+        queue_album_archive(self.album.pk)
+        self.assertEqual(self.builds().count(), 1)
+
+        # Changed contents need their own archive
+        ingest_photos(self.album, self.user, [jpeg_file('new.jpg', color=(0, 200, 0))])
+        queue_album_archive(self.album.pk)
+        self.assertEqual(self.builds().count(), 2)
+
+    def test_finished_build_can_be_queued_again(self):
+        queue_album_archive(self.album.pk)
+        self.builds().update(status=Job.STATUS_DONE)
+        queue_album_archive(self.album.pk)
+        self.assertEqual(self.builds().filter(status=Job.STATUS_QUEUED).count(), 1)
+
+    def test_download_link_warms_once(self):
+        AccessLink.objects.create(album=self.album, client_name='Smith', can_download=True)
+        AccessLink.objects.create(album=self.album, client_name='Jones', can_download=True)
+        self.assertEqual(self.builds().count(), 1)
+
+
+class AlbumUploadTests(MediaTestCase):
+    def upload(self, files):
+        return self.client.post(f'/api/albums/{self.album.pk}/upload/', {'images': files}, format='multipart')
+
+    def test_batch(self):
+        response = self.upload([jpeg_file('a.jpg'), jpeg_file('b.jpg', color=(0, 0, 200))])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([photo['title'] for photo in response.json()], ['a.jpg', 'b.jpg'])
+
+    def test_batch_with_a_non_image_is_rejected(self):
+        truncated = SimpleUploadedFile('broken.jpg', jpeg_bytes()[:20], content_type='image/jpeg')
+        text = SimpleUploadedFile('notes.jpg', b'not an image', content_type='image/jpeg')
+        good = jpeg_file('a.jpg', color=(10, 20, 30))
+        response = self.upload([good, truncated, text])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([failure['file'] for failure in response.json()['files']], ['broken.jpg', 'notes.jpg'])
+        self.assertFalse(Photo.objects.exists())
+        # Nothing was stored, not even the valid file
+        name = ContentAddressedStorage.hashed_name(f'photos/{self.user.pk}', sha256(good.read()), '.jpg')
+        self.assertFalse(Photo._meta.get_field('image').storage.exists(name))
+
+
+class SQLiteConfigurationTests(SimpleTestCase):
+    """
+    Runs against a file database with the project's SQLite settings, since
+    the test database lives in memory and cannot use WAL.
+    """
+
+    alias = 'sqlite_configuration'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Both aliases are registered by the tests themselves
+        cls.databases = {cls.alias, STRESS_DB_ALIAS}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        database = {**settings.DATABASES[DEFAULT_DB_ALIAS], 'NAME': os.path.join(directory, 'db.sqlite3')}
+        connections.settings[self.alias] = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: {}, self.alias: database}
+        )[self.alias]
+
+    def tearDown(self):
+        for alias in (self.alias, STRESS_DB_ALIAS):
+            if alias in connections.settings:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+
+    def test_new_connection_is_configured(self):
+        connection = connections[self.alias]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_concurrent_read_then_write(self):
+        stdout = io.StringIO()
+        call_command('sqlite_stress', processes=4, iterations=25, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('100 committed, 0 failed', stdout.getvalue())
+        self.assertIn('No lock errors or lost updates', stdout.getvalue())
+
+
+class AlbumListTests(MediaTestCase):
+    # Albums with their covers, tags, cover renditions, access links and selection counts
+    LIST_QUERIES = 5
+
+    def add_albums(self, count):
+        for index in range(Album.objects.count(), Album.objects.count() + count):
+            album = Album.objects.create(owner=self.user, title=f'Album {index}')
+            cover, photo = ingest_photos(album, self.user, [
+                jpeg_file(f'{index}a.jpg', color=(index, 0, 0)), jpeg_file(f'{index}b.jpg', color=(0, index, 0)),
+            ])
+            generate_renditions(cover)
+            album.tags.add(AlbumTag.objects.create(user=self.user, name=f'tag {index}'))
+            for client in ('Smith', 'Jones'):
+                link = AccessLink.objects.create(album=album, client_name=client)
+                ClientSelection.objects.create(access_link=link, photo=cover)
+                ClientSelection.objects.create(access_link=link, photo=photo)
+
+    def list_albums(self):
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get('/api/albums/')
+        self.assertEqual(response.status_code, 200)
+        return {album['title']: album for album in response.json()['results']}
+
+    def test_query_count_does_not_grow_with_albums(self):
+        self.album.delete()
+        self.add_albums(1)
+        self.assertEqual(len(self.list_albums()), 1)
+
+        self.add_albums(19)
+        albums = self.list_albums()
+        self.assertEqual(len(albums), 20)
+        album = albums['Album 7']
+        self.assertEqual(album['photo_count'], 2)
+        self.assertEqual([tag['name'] for tag in album['tags']], ['tag 7'])
+        self.assertEqual(album['client_selections'], {'Smith': 2, 'Jones': 2})
+        self.assertIn('/renditions/', album['cover_photo'])
+        self.assertNotIn('photos', album)
+
+    def test_retrieve_returns_the_full_album(self):
+        self.add_albums(1)
+        album = Album.objects.get(title='Album 1')
+        response = self.client.get(f'/api/albums/{album.pk}/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(set(data), set(AlbumSerializer.Meta.fields))
+        self.assertEqual(len(data['photos']), 2)
+        self.assertEqual({link['client_name'] for link in data['access_links']}, {'Smith', 'Jones'})
+        self.assertEqual({client: len(ids) for client, ids in data['client_selections'].items()}, {'Smith': 2, 'Jones': 2})
+
+
+class KeysetPaginationTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 20, 0, 0)) for i in range(7)])
+        # All on the same keys but the id, as rows from before sparse ordering are
+        Photo.objects.filter(album=self.album).update(order=ORDER_GAP, created_at=timezone.now())
+
+    def walk(self, url, **params):
+        ids = []
+        response = self.client.get(url, {**params, 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.json()['results']]
+            if not response.json()['next']:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPagination()
+        paginator.ordering = ('-created_at', 'id')
+        created_at = timezone.now().replace(microsecond=123456)
+        cursor = paginator._encode(Album(pk=5, created_at=created_at))
+        self.assertEqual(paginator._decode(cursor), [created_at.isoformat(), 5])
+
+    def test_photo_pages_on_tied_keys(self):
+        ids = self.walk('/api/photos/', album=self.album.pk)
+        self.assertEqual(ids, sorted(photo.pk for photo in self.photos))
+
+    def test_album_pages_on_tied_keys(self):
+        for index in range(4):
+            Album.objects.create(owner=self.user, title=f'Album {index}')
+        Album.objects.update(created_at=timezone.now())
+        ids = self.walk('/api/albums/')
+        self.assertEqual(ids, sorted(Album.objects.values_list('pk', flat=True)))
+
+    def test_favorite_pages_on_tied_keys(self):
+        for photo in self.photos:
+            Favorite.objects.create(user=self.user, photo=photo)
+        Favorite.objects.update(created_at=timezone.now())
+        ids = self.walk('/api/favorites/')
+        self.assertEqual(ids, sorted(photo.pk for photo in self.photos))
+
+    def test_nulls_sort_last_in_both_directions(self):
+        dated = self.photos[::2]
+        for day, photo in enumerate(dated, start=1):
+            Photo.objects.filter(pk=photo.pk).update(taken_at=timezone.now() - timedelta(days=day))
+        undated = sorted(photo.pk for photo in self.photos[1::2])
+
+        ids = self.walk('/api/photos/', ordering='taken_at')
+        self.assertEqual(ids, [photo.pk for photo in reversed(dated)] + undated)
+        ids = self.walk('/api/photos/', ordering='-taken_at')
+        self.assertEqual(ids, [photo.pk for photo in dated] + sorted(undated, reverse=True))
+
+    def test_unpaginated(self):
+        response = self.client.get('/api/photos/', {'paginate': 'false', 'page_size': 2})
+        self.assertEqual(len(response.json()), 7)
+
+    def test_invalid_cursor(self):
+        def encode(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for cursor in ('not a cursor', encode({'order': 1}), encode([ORDER_GAP]), encode([ORDER_GAP, 'yesterday', 1])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/photos/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class AlbumAggregateTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photos = ingest_photos(self.album, self.user, [
+            jpeg_file(f'{i}.jpg', size=(40 + i * 20, 30), color=(i * 40, 0, 0)) for i in range(3)
+        ])
+
+    def assertAggregates(self, album, photos):
+        album.refresh_from_db()
+        self.assertEqual(album.photo_count, len(photos))
+        self.assertEqual(album.cover_photo_id, photos[0].pk if photos else None)
+        self.assertEqual(album.total_bytes, sum(photo.file_size for photo in photos))
+
+    def test_ingest(self):
+        self.assertAggregates(self.album, self.photos)
+
+    def test_create_and_delete(self):
+        response = self.client.post('/api/photos/', {'album': self.album.pk, 'title': 'New', 'image': jpeg_file('new.jpg')})
+        self.assertEqual(response.status_code, 201)
+        self.assertAggregates(self.album, self.photos + [Photo.objects.get(pk=response.json()['id'])])
+
+        self.assertEqual(self.client.delete(f'/api/photos/{self.photos[0].pk}/').status_code, 204)
+        self.assertAggregates(self.album, Photo.objects.filter(album=self.album).order_by('order'))
+
+    def test_move_between_albums(self):
+        other = Album.objects.create(owner=self.user, title='Jones engagement')
+        first = self.photos[0]
+        first.album = other
+        first.save()
+        self.assertAggregates(self.album, self.photos[1:])
+        self.assertAggregates(other, [first])
+
+    def test_reorder(self):
+        a, b, c = self.photos
+        self.client.post(f'/api/albums/{self.album.pk}/reorder-photos/', {'photo_ids': [c.pk, a.pk, b.pk]}, format='json')
+        self.assertAggregates(self.album, [c, a, b])
+        self.client.post(f'/api/albums/{self.album.pk}/reorder-photos/', {'move': {'photo': b.pk, 'before': c.pk}}, format='json')
+        self.assertAggregates(self.album, [b, c, a])
+
+    def test_recompute_repairs_drift(self):
+        empty = Album.objects.create(owner=self.user, title='Empty')
+        Album.objects.filter(pk=self.album.pk).update(photo_count=99, cover_photo=None, total_bytes=1)
+        stdout = io.StringIO()
+        call_command('recompute_album_aggregates', stdout=stdout)
+        self.assertIn('Checked 2 albums, repaired 1', stdout.getvalue())
+        self.assertAggregates(self.album, self.photos)
+        self.assertAggregates(empty, [])
+
+
+class FavoriteTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 40, 0, 0)) for i in range(4)])
+        self.ids = [photo.pk for photo in self.photos]
+
+    def bulk(self, **data):
+        return self.client.post('/api/favorites/bulk/', {'add': [], 'remove': [], **data}, format='json')
+
+    def favorited(self):
+        return sorted(Favorite.objects.filter(user=self.user).values_list('photo_id', flat=True))
+
+    def test_bulk_add_and_remove(self):
+        a, b, c, d = self.ids
+        response = self.bulk(add=[a, b, c])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['favorited'], [a, b, c])
+        # Adding again and removing non-favorites change nothing
+        self.assertEqual(self.bulk(add=[a, b], remove=[d]).json()['favorited'], [a, b])
+        self.assertEqual(self.favorited(), [a, b, c])
+
+        self.assertEqual(self.bulk(remove=[a, c]).json()['favorited'], [])
+        self.assertEqual(self.bulk(remove=[a, c]).status_code, 200)
+        self.assertEqual(self.favorited(), [b])
+
+    def test_bulk_leaves_other_users_photos_alone(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        album = Album.objects.create(owner=other, title='Other')
+        [photo] = ingest_photos(album, other, [jpeg_file('other.jpg', color=(0, 0, 250))])
+        Favorite.objects.create(user=other, photo=photo)
+
+        response = self.bulk(add=[self.ids[0], photo.pk])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['photo_ids'], [photo.pk])
+        self.assertEqual(self.favorited(), [])
+        self.assertEqual(self.bulk(remove=[photo.pk]).status_code, 404)
+        self.assertTrue(Favorite.objects.filter(user=other, photo=photo).exists())
+
+    def test_is_favorited_is_annotated(self):
+        a, b, c, d = self.ids
+        self.bulk(add=[b, d])
+        # The photos with their favorite flag, and their renditions
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/photos/', {'album': self.album.pk})
+        flags = {photo['id']: photo['is_favorited'] for photo in response.json()['results']}
+        self.assertEqual(flags, {a: False, b: True, c: False, d: True})
+
+        ingest_photos(self.album, self.user, [jpeg_file(f'more{i}.jpg', color=(0, i * 40, 0)) for i in range(4)])
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/photos/', {'album': self.album.pk})
+        self.assertEqual(len(response.json()['results']), 8)
+
+        photos = self.client.get(f'/api/albums/{self.album.pk}/').json()['photos']
+        self.assertEqual([photo['id'] for photo in photos if photo['is_favorited']], [b, d])
+
+    def test_favorites_list(self):
+        self.bulk(add=self.ids)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/favorites/')
+        self.assertEqual(sorted(photo['id'] for photo in response.json()['results']), self.ids)
+        self.assertTrue(all(photo['is_favorited'] for photo in response.json()['results']))
+
+
+class RenditionFormatTests(PhotoMediaTestCase):
+    def setUp(self):
+        super().setUp()
+        generate_renditions(self.photo)
+        self.rendition = self.photo.renditions.get(size='thumb')
+        self.url = self.rendition.image.url
+        storage = self.rendition.image.storage
+        # Stand-ins, so the tests don't depend on the encoders Pillow was built with
+        self.rendition.variants = {
+            name: storage.save(f'renditions/{self.photo.pk}_thumb.{name}', ContentFile(name.encode()))
+            for name in ('avif', 'webp')
+        }
+        self.rendition.save()
+        with self.rendition.image.open('rb') as f:
+            self.jpeg = f.read()
+
+    def fetch(self, accept):
+        response = self.anonymous.get(self.url, HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', [value.strip() for value in response['Vary'].split(',')])
+        return self.content(response)
+
+    def test_accept_picks_the_format(self):
+        self.assertEqual(self.fetch('image/avif,image/webp,*/*'), b'avif')
+        self.assertEqual(self.fetch('image/webp,*/*;q=0.8'), b'webp')
+        self.assertEqual(self.fetch('image/avif;q=0,image/webp'), b'webp')
+        self.assertEqual(self.fetch('*/*'), self.jpeg)
+        self.assertEqual(self.fetch(''), self.jpeg)
+
+    def test_missing_variant_falls_back(self):
+        self.rendition.variants = {'webp': self.rendition.variants['webp']}
+        self.rendition.save()
+        self.assertEqual(self.fetch('image/avif,*/*'), self.jpeg)
+        self.assertEqual(self.fetch('image/avif,image/webp'), b'webp')
+
+
+class DuplicateClusterTests(SimpleTestCase):
+    def test_tree_search_matches_brute_force(self):
+        generator = random.Random(13)
+        base = generator.getrandbits(64)
+        # Hashes around one photo, so some are near each other
+        keys = [base ^ generator.getrandbits(64) & generator.getrandbits(64) & generator.getrandbits(64) for _ in range(300)]
+        tree = BKTree()
+        for index, key in enumerate(keys):
+            tree.add(key, index)
+        for radius in (0, 4, 10):
+            for probe in keys[:20]:
+                expected = sorted((hamming(probe, key), index) for index, key in enumerate(keys) if hamming(probe, key) <= radius)
+                self.assertEqual(sorted(tree.search(probe, radius)), expected)
+
+    def test_threshold_is_inclusive(self):
+        self.assertEqual(duplicate_clusters([('a', 0), ('b', 0b111)], 3), [['a', 'b']])
+        self.assertEqual(duplicate_clusters([('a', 0), ('b', 0b1111)], 3), [])
+
+    def test_clusters_are_transitive(self):
+        # a-b and b-c are two bits apart, a-c four
+        hashes = [('a', 0), ('b', 0b11), ('c', 0b1111), ('x', 0xFF00), ('y', 0xFF01), ('lone', 0xF0F0F0)]
+        self.assertEqual(duplicate_clusters(hashes, 2), [['a', 'b', 'c'], ['x', 'y']])
+
+    def test_signed_hashes(self):
+        # Stored two's complement; the top bit set makes them negative
+        negative = to_signed((1 << 63) | 1)
+        self.assertLess(negative, 0)
+        # Four bits apart as unsigned hashes
+        self.assertEqual(duplicate_clusters([('a', negative), ('b', 0b110)], 4), [['a', 'b']])
+        self.assertEqual(duplicate_clusters([('a', negative), ('b', 0b110)], 3), [])
+
+
+class DuplicateEndpointTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 40, 0, 0)) for i in range(4)])
+        for photo, phash in zip(self.photos, (0, 0b1, 0xFFFF, None)):
+            Photo.objects.filter(pk=photo.pk).update(phash=phash)
+
+    def duplicates(self, client=None, **params):
+        return (client or self.client).get(f'/api/albums/{self.album.pk}/duplicates/', params)
+
+    def test_clusters(self):
+        a, b, c, d = self.photos
+        response = self.duplicates()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['clusters'], [[a.pk, b.pk]])
+        self.assertEqual(self.duplicates(distance=0).json()['clusters'], [])
+        self.assertEqual(self.duplicates(distance=16).json()['clusters'], [[a.pk, b.pk, c.pk]])
+
+    def test_invalid_distance(self):
+        self.assertEqual(self.duplicates(distance='near').status_code, 400)
+        self.assertEqual(self.duplicates(distance=17).status_code, 400)
+
+    def test_owner_scoping(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(self.duplicates(client).status_code, 404)
+
+        # The same hash in another album doesn't join this album's clusters
+        album = Album.objects.create(owner=self.user, title='Jones engagement')
+        [copy] = ingest_photos(album, self.user, [jpeg_file('copy.jpg', color=(0, 0, 250))])
+        Photo.objects.filter(pk=copy.pk).update(phash=0)
+        self.assertEqual(self.duplicates().json()['clusters'], [[self.photos[0].pk, self.photos[1].pk]])
+
+
+def exif_jpeg_file(name, make, model, taken_at, iso, focal_length, location=None, color=(200, 10, 10)):
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = make
+    exif[ExifTags.Base.Model] = model
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    details[ExifTags.Base.DateTimeOriginal] = taken_at
+    details[ExifTags.Base.OffsetTimeOriginal] = '+02:00'
+    details[ExifTags.Base.ISOSpeedRatings] = iso
+    details[ExifTags.Base.FocalLength] = IFDRational(focal_length, 1)
+    if location:
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        latitude, longitude = location
+        gps[ExifTags.GPS.GPSLatitudeRef], gps[ExifTags.GPS.GPSLatitude] = 'N', (IFDRational(latitude, 1), 0, 0)
+        gps[ExifTags.GPS.GPSLongitudeRef], gps[ExifTags.GPS.GPSLongitude] = 'W', (IFDRational(longitude, 1), 0, 0)
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ExifTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.canon, self.nikon, self.plain = ingest_photos(self.album, self.user, [
+            exif_jpeg_file('canon.jpg', 'Canon', 'EOS R5', '2024:05:01 14:30:00', 400, 85, location=(52, 4)),
+            exif_jpeg_file('nikon.jpg', 'NIKON CORPORATION', 'Z 6', '2023:08:12 09:00:00', 3200, 24, color=(0, 200, 0)),
+            jpeg_file('plain.jpg', color=(0, 0, 200)),
+        ])
+
+    def listed(self, **params):
+        response = self.client.get('/api/photos/', params)
+        self.assertEqual(response.status_code, 200)
+        return [photo['id'] for photo in response.json()['results']]
+
+    def test_ingest_reads_metadata(self):
+        photo = Photo.objects.get(pk=self.canon.pk)
+        self.assertEqual((photo.camera_make, photo.camera_model, photo.iso, photo.focal_length), ('Canon', 'EOS R5', 400, 85))
+        self.assertEqual(photo.taken_at, datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual((photo.latitude, photo.longitude), (52, -4))
+        self.assertTrue(Photo.objects.get(pk=self.plain.pk).exif_extracted)
+
+    def test_filters(self):
+        self.assertEqual(self.listed(camera_make='canon'), [self.canon.pk])
+        self.assertEqual(self.listed(iso_min=1000), [self.nikon.pk])
+        self.assertEqual(self.listed(focal_length_max=50), [self.nikon.pk])
+        self.assertEqual(self.listed(taken_after='2024-01-01'), [self.canon.pk])
+        self.assertEqual(self.listed(taken_before='2024-01-01', album=self.album.pk), [self.nikon.pk])
+        self.assertEqual(self.listed(has_location='true'), [self.canon.pk])
+        self.assertEqual(self.listed(has_location='false'), [self.nikon.pk, self.plain.pk])
+
+    def test_invalid_filter_values(self):
+        for params in ({'iso_min': 'high'}, {'focal_length_max': 'wide'}, {'taken_after': 'last summer'}, {'album': 'smith'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/photos/', params).status_code, 400)
+
+    def test_ordering(self):
+        self.assertEqual(self.listed(ordering='taken_at'), [self.nikon.pk, self.canon.pk, self.plain.pk])
+        self.assertEqual(self.listed(ordering='-iso'), [self.nikon.pk, self.canon.pk, self.plain.pk])
+        # Columns without an index are ignored
+        self.assertEqual(self.listed(ordering='title'), [self.canon.pk, self.nikon.pk, self.plain.pk])
+
+    def test_backfill(self):
+        Photo.objects.update(exif_extracted=False, camera_make='', camera_model='', taken_at=None, iso=None, latitude=None, longitude=None)
+        stdout = io.StringIO()
+        call_command('backfill_exif', batch_size=2, stdout=stdout)
+        self.assertIn('Extracted metadata for 3 photos (0 failed)', stdout.getvalue())
+        photo = Photo.objects.get(pk=self.canon.pk)
+        self.assertEqual((photo.camera_make, photo.iso, photo.latitude), ('Canon', 400, 52))
+        self.assertEqual(photo.taken_at, datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc))
+        self.assertFalse(Photo.objects.filter(exif_extracted=False).exists())
+
+
+class AvatarTests(MediaTestCase):
+    def upload(self, upload):
+        return self.client.put('/api/user/update-avatar/', {'avatar': upload}, format='multipart')
+
+    def test_variants(self):
+        response = self.upload(jpeg_file('me.jpg', size=(300, 200)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['avatar_variants']), set(AVATAR_SIZES))
+
+        variants = {variant.size: variant for variant in self.user.userprofile.avatar_variants.all()}
+        # Square crops, never upscaled past the original's shorter side
+        self.assertEqual({size: variant.edge for size, variant in variants.items()}, {'small': 64, 'medium': 160, 'large': 200})
+        for variant in variants.values():
+            with variant.image.open('rb') as f, Image.open(f) as img:
+                self.assertEqual(img.size, (variant.edge, variant.edge))
+
+        self.assertEqual(self.upload(jpeg_file('new.jpg', size=(500, 500), color=(0, 90, 0))).status_code, 200)
+        variants = self.user.userprofile.avatar_variants.all()
+        self.assertEqual(sorted(variant.edge for variant in variants), [64, 160, 400])
+
+    def test_non_image_is_rejected(self):
+        response = self.upload(SimpleUploadedFile('me.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.user.userprofile.avatar)
+        self.assertFalse(self.user.userprofile.avatar_variants.exists())
+
+    def test_pixel_cap(self):
+        with mock.patch('api.avatars.AVATAR_MAX_PIXELS', 100 * 100):
+            response = self.upload(jpeg_file('huge.jpg', size=(101, 100)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Image is too large')
+        self.assertFalse(self.user.userprofile.avatar_variants.exists())
+
+
+class ZipStreamTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.contents = {
+            # Several read chunks long, and incompressible like a real JPEG
+            'photos/a.jpg': random.Random(3).randbytes(3 * CHUNK_SIZE + 100),
+            'photos/b.JPEG': jpeg_bytes(),
+            'notes.txt': b'smith wedding ' * 5000,
+        }
+        self.files = []
+        for arcname, data in self.contents.items():
+            path = os.path.join(directory, arcname.replace('/', '_'))
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.files.append((arcname, path))
+
+    def test_archive_is_valid(self):
+        with zipfile.ZipFile(io.BytesIO(b''.join(iter_zip(self.files)))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), list(self.contents))
+            for arcname, data in self.contents.items():
+                self.assertEqual(archive.read(arcname), data)
+            types = {info.filename: info.compress_type for info in archive.infolist()}
+        self.assertEqual(types, {
+            'photos/a.jpg': zipfile.ZIP_STORED, 'photos/b.JPEG': zipfile.ZIP_STORED, 'notes.txt': zipfile.ZIP_DEFLATED,
+        })
+
+    def test_compression_for(self):
+        for name in ('a.jpg', 'b.JPG', 'c.jpeg', 'd.png', 'e.webp', 'f.avif', 'g.heic'):
+            self.assertEqual(compression_for(name), zipfile.ZIP_STORED)
+        for name in ('notes.txt', 'raw.cr2', 'no_extension'):
+            self.assertEqual(compression_for(name), zipfile.ZIP_DEFLATED)
+
+    def test_streams_in_chunks(self):
+        chunks = iter_zip(self.files)
+        first = next(chunks)
+        # The first file is still being read when its first chunk comes out
+        self.assertLessEqual(len(first), CHUNK_SIZE + 1024)
+        rest = list(chunks)
+        self.assertGreater(len(rest), 3)
+        self.assertLessEqual(max(len(chunk) for chunk in rest), CHUNK_SIZE + 1024)
+        with zipfile.ZipFile(io.BytesIO(first + b''.join(rest))) as archive:
+            self.assertIsNone(archive.testzip())
+
+
+class MediaLayoutMigrationTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = Photo._meta.get_field('image').storage
+        self.photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 60, 0, 0)) for i in range(3)])
+        # Originals from before content addressing: flat names, no hash
+        # recorded, and two photos sharing one file
+        self.data = [jpeg_bytes(color=(0, 200, 0)), jpeg_bytes(color=(0, 0, 200))]
+        for name, data in zip(('photos/IMG_0001.JPG', 'photos/IMG_0002.jpg'), self.data):
+            with open(self.storage.path(name), 'wb') as f:
+                f.write(data)
+        a, b, c = self.photos
+        Photo.objects.filter(pk__in=[a.pk, b.pk]).update(image='photos/IMG_0001.JPG', sha256='')
+        Photo.objects.filter(pk=c.pk).update(image='photos/IMG_0002.jpg', sha256='')
+
+    def migrate(self):
+        stdout = io.StringIO()
+        call_command('migrate_media_layout', batch_size=2, stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_moves_flat_files(self):
+        self.assertIn('Moved 3 photos (0 already in place, 0 missing)', self.migrate())
+        a, b, c = (Photo.objects.get(pk=photo.pk) for photo in self.photos)
+        digest = sha256(self.data[0])
+        self.assertEqual(a.image.name, f'photos/{self.user.pk}/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual((a.image.name, a.sha256, a.file_size), (b.image.name, digest, len(self.data[0])))
+        self.assertEqual(c.sha256, sha256(self.data[1]))
+        with c.image.open('rb') as f:
+            self.assertEqual(f.read(), self.data[1])
+        self.assertFalse(self.storage.exists('photos/IMG_0001.JPG'))
+        self.assertFalse(self.storage.exists('photos/IMG_0002.jpg'))
+
+    def test_rerun_is_a_no_op(self):
+        self.migrate()
+        names = list(Photo.objects.order_by('pk').values_list('image', flat=True))
+        self.assertIn('Moved 0 photos (3 already in place, 0 missing)', self.migrate())
+        self.assertEqual(list(Photo.objects.order_by('pk').values_list('image', flat=True)), names)
+
+    def test_missing_file_is_skipped(self):
+        os.remove(self.storage.path('photos/IMG_0002.jpg'))
+        self.assertIn('Moved 2 photos (0 already in place, 1 missing)', self.migrate())
+        self.assertEqual(Photo.objects.get(pk=self.photos[2].pk).image.name, 'photos/IMG_0002.jpg')
+
+
+class PlaceholderTests(MediaTestCase):
+    @override_settings(JOB_QUEUE={**settings.JOB_QUEUE, 'EAGER': True})
+    def test_generated_on_ingest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/albums/{self.album.pk}/upload/', {'images': [jpeg_file('a.jpg')]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        photo = self.client.get(f"/api/photos/{response.json()[0]['id']}/").json()
+        self.assertEqual(photo['processing_status'], Photo.PROCESSING_READY)
+        self.assertTrue(photo['placeholder'].startswith('data:image/webp;base64,'))
+
+    def test_backfill(self):
+        photos = ingest_photos(self.album, self.user, [jpeg_file(f'{i}.jpg', color=(i * 60, 0, 0)) for i in range(3)])
+        # One with renditions, which the placeholder is made from; one already done
+        generate_renditions(photos[0])
+        Photo.objects.filter(pk=photos[2].pk).update(placeholder='data:image/webp;base64,kept')
+        Photo.objects.filter(pk=photos[0].pk).update(placeholder='')
+
+        stdout = io.StringIO()
+        call_command('backfill_placeholders', processes=2, batch_size=2, stdout=stdout)
+        self.assertIn('Computed placeholders for 2 photos (0 failed)', stdout.getvalue())
+        placeholders = dict(Photo.objects.values_list('pk', 'placeholder'))
+        for photo in photos[:2]:
+            self.assertTrue(placeholders[photo.pk].startswith('data:image/webp;base64,'))
+        self.assertEqual(placeholders[photos[2].pk], 'data:image/webp;base64,kept')
+
+
+@override_settings(JOB_QUEUE={**settings.JOB_QUEUE, 'EAGER': True})
+class RenditionTests(MediaTestCase):
+    def upload(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/albums/{self.album.pk}/upload/', {'images': [jpeg_file(**kwargs)]}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return self.client.get(f"/api/photos/{response.json()[0]['id']}/").json()
+
+    def test_renditions_are_served(self):
+        photo = self.upload(size=(3000, 2000))
+        self.assertEqual((photo['width'], photo['height']), (3000, 2000))
+        self.assertEqual({size: rendition['width'] for size, rendition in photo['renditions'].items()}, RENDITION_SIZES)
+        for rendition in photo['renditions'].values():
+            self.assertAlmostEqual(rendition['height'], rendition['width'] * 2 / 3, delta=1)
+        self.assertEqual(photo['srcset'].count(', '), 3)
+
+        anonymous = APIClient()
+        for rendition in photo['renditions'].values():
+            response = anonymous.get(rendition['url'], HTTP_ACCEPT='image/jpeg')
+            self.assertEqual(response.status_code, 200)
+            with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+                self.assertEqual((img.format, img.size), ('JPEG', (rendition['width'], rendition['height'])))
+
+    def test_small_originals_are_not_upscaled(self):
+        photo = self.upload(size=(200, 150))
+        self.assertEqual({rendition['width'] for rendition in photo['renditions'].values()}, {200})
+        self.assertEqual(photo['srcset'].count(' 200w'), 1)
+
+    def test_generate_renditions_command(self):
+        [photo] = ingest_photos(self.album, self.user, [jpeg_file(size=(1000, 500))])
+        stdout = io.StringIO()
+        call_command('generate_renditions', stdout=stdout)
+        self.assertIn('Generated renditions for 1 photos (0 failed)', stdout.getvalue())
+        renditions = self.client.get(f'/api/photos/{photo.pk}/').json()['renditions']
+        self.assertEqual(renditions['grid']['width'], 800)
+
+
+class IterBatchesTests(TestCase):
+    def test_batches_in_pk_order(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        albums = [Album.objects.create(owner=user, title=f'Album {index}').pk for index in range(5)]
+        batches = [[album.pk for album in batch] for batch in iter_batches(Album.objects.order_by('-title'), 2)]
+        self.assertEqual(batches, [albums[:2], albums[2:4], albums[4:]])
+        batches = [[album.pk for album in batch] for batch in iter_batches(Album.objects.all(), 2, after_id=albums[2])]
+        self.assertEqual(batches, [albums[3:]])
+
+    def test_rows_saved_between_batches(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        albums = [Album.objects.create(owner=user, title=f'Album {index}').pk for index in range(4)]
+        seen = []
+        for batch in iter_batches(Album.objects.filter(title__startswith='Album'), 2):
+            seen += [album.pk for album in batch]
+            # Marks this batch done and drops the next album out of the queryset
+            Album.objects.filter(pk__in=seen + [albums[2]]).update(title='Done')
+        self.assertEqual(seen, [albums[0], albums[1], albums[3]])
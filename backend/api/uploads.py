@@ -0,0 +1,216 @@
+"""
+Resumable chunked uploads.
+
+A client creates an UploadSession, PUTs each fixed-size chunk (in any order,
+and again after a failure) and then completes the session, which turns the
+assembled file into a Photo. Each chunk is checked against its SHA-256 before
+it is written into a sparse part file at its offset, so no file is ever held
+in memory as a whole, and the assembled file is checked against the chunk
+hashes again before it is accepted.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .ingest import IngestError, ingest_photos
+from .models import UploadChunk, UploadSession
+
+COPY_BUFFER_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _PartFile(File):
+    # Exposing the path lets the storage move the part file into place
+    # instead of copying it
+    def __init__(self, file, name, path):
+        super().__init__(file, name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def upload_setting(name):
+    return settings.UPLOAD_SESSIONS[name]
+
+
+def part_path(session):
+    return os.path.join(upload_setting('DIR'), f"{session.pk}.part")
+
+
+def create_session(owner, album, filename, total_size, chunk_size=None, sha256=''):
+    chunk_size = chunk_size or upload_setting('CHUNK_SIZE')
+    if total_size <= 0 or total_size > upload_setting('MAX_FILE_SIZE'):
+        raise UploadError('Invalid file size')
+    if not 0 < chunk_size <= upload_setting('MAX_CHUNK_SIZE'):
+        raise UploadError('Invalid chunk size')
+
+    session = UploadSession.objects.create(
+        owner=owner,
+        album=album,
+        filename=os.path.basename(filename)[:255],
+        total_size=total_size,
+        chunk_size=chunk_size,
+        sha256=sha256.lower(),
+    )
+    os.makedirs(upload_setting('DIR'), exist_ok=True)
+    with open(part_path(session), 'wb') as part:
+        # Sparse on most filesystems; chunks fill it in at their offsets
+        part.truncate(total_size)
+    return session
+
+
+def write_chunk(session, index, stream, checksum):
+    """
+    Receive one chunk from ``stream``, check it against ``checksum`` and only
+    then copy it into the part file and record it.
+    """
+    if session.photo_id:
+        raise UploadError('Upload already completed', status=409)
+    if not 0 <= index < session.chunk_count:
+        raise UploadError('Chunk index out of range')
+    if stream is None:
+        raise UploadError('Empty chunk')
+
+    expected = session.chunk_length(index)
+    digest = hashlib.sha256()
+    received = 0
+    # Small chunks stay in memory, larger ones spill to disk next to the part file
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=upload_setting('DIR')) as buffer:
+        while received <= expected:
+            data = stream.read(min(COPY_BUFFER_SIZE, expected + 1 - received))
+            if not data:
+                break
+            received += len(data)
+            if received > expected:
+                break
+            digest.update(data)
+            buffer.write(data)
+
+        # Nothing has touched the part file yet, so a previously accepted
+        # copy of this chunk is still intact
+        if received != expected:
+            raise UploadError(f'Chunk {index} must be {expected} bytes')
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError(f'Checksum mismatch for chunk {index}')
+
+        # Unrecord the chunk while its range is rewritten, so a failed write
+        # leaves it missing rather than recorded over bad bytes
+        UploadChunk.objects.filter(session=session, index=index).delete()
+        buffer.seek(0)
+        with open(part_path(session), 'r+b') as part:
+            part.seek(index * session.chunk_size)
+            shutil.copyfileobj(buffer, part, COPY_BUFFER_SIZE)
+
+    UploadChunk.objects.create(session=session, index=index, size=received, sha256=digest.hexdigest())
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+
+def progress(session):
+    received = list(session.chunks.values_list('index', flat=True))
+    return {
+        'id': session.pk,
+        'album': session.album_id,
+        'filename': session.filename,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'chunk_count': session.chunk_count,
+        'received_chunks': received,
+        'received_bytes': sum(session.chunk_length(index) for index in received),
+        'complete': session.photo_id is not None,
+        'photo': session.photo_id,
+    }
+
+
+def _verify_part_file(session):
+    """
+    Re-read the assembled file and check it against the hash recorded for
+    each chunk and, if the client gave one, the hash of the whole file.
+    """
+    recorded = dict(session.chunks.values_list('index', 'sha256'))
+    whole = hashlib.sha256()
+    with open(part_path(session), 'rb') as f:
+        for index in range(session.chunk_count):
+            digest = hashlib.sha256()
+            remaining = session.chunk_length(index)
+            while remaining:
+                data = f.read(min(COPY_BUFFER_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                digest.update(data)
+                whole.update(data)
+            if digest.hexdigest() != recorded.get(index):
+                # Drop the record so progress shows the chunk as missing again
+                session.chunks.filter(index=index).delete()
+                raise UploadError(f'Chunk {index} is corrupt; send it again', status=409)
+    if session.sha256 and whole.hexdigest() != session.sha256:
+        raise UploadError('Checksum mismatch for assembled file')
+
+
+def complete_session(session):
+    """Turn a fully received session into a Photo and queue its processing."""
+    if session.photo_id:
+        return session.photo
+    if session.chunks.count() != session.chunk_count:
+        raise UploadError('Upload is missing chunks', status=409)
+
+    path = part_path(session)
+    _verify_part_file(session)
+
+    with transaction.atomic():
+        with open(path, 'rb') as f:
+            try:
+                [photo] = ingest_photos(session.album, session.owner, [_PartFile(f, session.filename, path)])
+            except IngestError:
+                raise UploadError('Uploaded file is not an image')
+        session.photo = photo
+        session.save(update_fields=['photo', 'updated_at'])
+        session.chunks.all().delete()
+
+    # Already gone if the storage moved it into place
+    if os.path.exists(path):
+        os.remove(path)
+    return photo
+
+
+def delete_session(session):
+    if os.path.exists(part_path(session)):
+        os.remove(part_path(session))
+    session.delete()
+
+
+def cleanup_sessions(max_age=None):
+    """
+    Delete sessions not touched for ``max_age`` along with their part files,
+    plus any part file without a session. Returns the number of sessions removed.
+    """
+    max_age = max_age or timedelta(seconds=upload_setting('EXPIRE_AFTER'))
+    cutoff = timezone.now() - max_age
+    removed = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        delete_session(session)
+        removed += 1
+
+    directory = upload_setting('DIR')
+    if os.path.isdir(directory):
+        known = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(directory):
+            # The age check keeps us away from sessions created during the scan
+            if (entry.name.endswith('.part') and entry.name[:-len('.part')] not in known
+                    and entry.stat().st_mtime < cutoff.timestamp()):
+                os.remove(entry.path)
+    return removed
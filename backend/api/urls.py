@@ -16,8 +16,14 @@ urlpatterns = [
     # path('register/', views.register, name='register'),
     path('albums/<int:album_id>/reorder-photos/', views.reorder_photos, name='reorder-photos'),
     path('favorites/', views.get_favorites, name='get-favorites'),
+    path('favorites/bulk/', views.bulk_favorites, name='bulk-favorites'),
+    path('search/', views.search, name='search'),
     path('photos/<int:photo_id>/toggle-favorite/', views.toggle_favorite, name='toggle-favorite'),
     path('user/update-avatar/', views.update_avatar, name='update_avatar'),
+    path('uploads/', views.UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:session_id>/', views.UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:session_id>/chunks/<int:index>/', views.UploadChunkView.as_view(), name='upload-chunk'),
+    path('uploads/<uuid:session_id>/complete/', views.UploadCompleteView.as_view(), name='upload-complete'),
 
     path('', include(router.urls)),
     path('auth/login/', views.CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -2,24 +2,31 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.tokens import default_token_generator
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation, ValidationError
+from django.core.files.storage import default_storage
 from django.core.mail import send_mail
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse, Http404
 from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.html import strip_tags
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, content_disposition_header
 from django.utils.encoding import force_bytes, force_str
 from django.views.decorators.http import require_http_methods
 
-from rest_framework import viewsets, status, permissions, generics
+from rest_framework import viewsets, status, permissions, generics, serializers
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework.filters import OrderingFilter
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework import permissions
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -28,22 +35,40 @@ from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from allauth.socialaccount.models import SocialAccount
 from uuid import uuid4
 
-import json, jwt, zipfile, io, os, requests, uuid
+import json, jwt, os, posixpath, requests, uuid
 
 from datetime import timedelta, datetime
 
-from .models import Photo, Album, Favorite, UserProfile, AlbumTag, LoginAttempt, AccessLink, ClientSelection, ClientAccessToken
+from .models import Photo, Album, Favorite, UserProfile, AlbumTag, LoginAttempt, AccessLink, ClientSelection, ClientAccessToken, UploadSession
 from .serializers import (
-    UserSerializer, PhotoSerializer, AlbumSerializer, AlbumTagSerializer,
+    UserSerializer, PhotoSerializer, AlbumSerializer, AlbumListSerializer, AlbumTagSerializer, AlbumTagCountSerializer,
     UserRegistrationSerializer, PasswordResetRequestSerializer,
-    PasswordResetConfirmSerializer, EmailConfirmationSerializer,
-    CustomTokenObtainPairSerializer
+    PasswordResetConfirmSerializer, EmailConfirmationSerializer, FavoriteBulkSerializer, PhotoReorderSerializer,
+    CustomTokenObtainPairSerializer, rendition_map
 )
-from .authentication import ClientAccessTokenAuthentication
+from .authentication import ClientAccessTokenAuthentication, MediaAccessAuthentication
+from .jobs import enqueue
+from .zipstream import iter_zip
+from .archives import album_photos, archive_entries, get_cached_archive, queue_album_archive
+from .media import can_access_media, negotiate_format, rendition_variants, serve_file
+from .storage import has_valid_signature
+from .similarity import duplicate_clusters
+from .ingest import IngestError, ingest_photos
+from .ordering import ReorderError, append_order, move_photo, set_photo_order
+from .search import KINDS as SEARCH_KINDS, search as search_index
+from .tags import TAG_MODE_ANY, TAG_MODES, filter_albums_by_tags, tag_counts
+from .pagination import KeysetPagination
+from .avatars import AvatarError, avatar_urls, set_avatar
+from .uploads import UploadError, create_session, write_chunk, progress, complete_session, delete_session
 
 
 User = get_user_model()
 
+# Hamming distances between 64-bit photo hashes for the duplicates endpoint;
+# beyond about a quarter of the bits unrelated photos start to match
+DEFAULT_DUPLICATE_DISTANCE = 6
+MAX_DUPLICATE_DISTANCE = 16
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
@@ -167,35 +192,28 @@ def google_login(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def reorder_photos(request, album_id):
+    """
+    Move one photo (``{"move": {"photo": id, "after": id, "before": id}}``) or
+    set the album's full order (``photo_ids`` or ``photo_orders``). Pass the
+    album's ``version`` to have the request rejected with 409 if the album was
+    reordered since.
+    """
+    album = get_object_or_404(Album, id=album_id, owner=request.user)
+    serializer = PhotoReorderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
     try:
-        album = Album.objects.get(id=album_id, owner=request.user)
-        photo_orders = request.data.get('photo_orders', [])
-        
-        if not photo_orders:
-            return Response({'error': 'No photo orders provided'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update the order of each photo
-        for photo_data in photo_orders:
-            photo_id = photo_data.get('id')
-            new_order = photo_data.get('order')
-            
-            if photo_id is None or new_order is None:
-                return Response({'error': 'Invalid photo order data'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            
-            try:
-                photo = Photo.objects.get(id=photo_id, album=album)
-                photo.order = new_order
-                photo.save()
-            except Photo.DoesNotExist:
-                return Response({'error': f'Photo with id {photo_id} not found'}, 
-                              status=status.HTTP_404_NOT_FOUND)
-        
-        return Response({'message': 'Photos reordered successfully'})
-    except Album.DoesNotExist:
-        return Response({'error': 'Album not found'}, 
-                       status=status.HTTP_404_NOT_FOUND)
+        if 'move' in data:
+            move = data['move']
+            order = move_photo(album, move['photo'], after=move['after'], before=move['before'], version=data['version'])
+            return Response({'message': 'Photo moved', 'order': order, 'version': album.order_version})
+        set_photo_order(album, data['photo_ids'], version=data['version'])
+    except ReorderError as e:
+        # Nothing was changed; report the version the client should reload at
+        album.refresh_from_db(fields=['order_version'])
+        return Response({'error': str(e), 'version': album.order_version}, status=e.status)
+    return Response({'message': 'Photos reordered successfully', 'version': album.order_version})
 
 def album_detail(request, id):
     try:
@@ -204,31 +222,168 @@ def album_detail(request, id):
     except Album.DoesNotExist:
         return JsonResponse({'error': 'Album not found'}, status=404)
 
+def with_favorited(photos, user):
+    """Annotate ``is_favorited`` for ``user`` on a photo queryset, as a subquery of the same SELECT."""
+    return photos.annotate(is_favorited=Exists(Favorite.objects.filter(user=user, photo=OuterRef('pk'))))
+
 class PhotoViewSet(viewsets.ModelViewSet):
     queryset = Photo.objects.all()
     serializer_class = PhotoSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [OrderingFilter]
+    # Only indexed columns, so ?ordering= cannot force a sort over the whole table
+    ordering_fields = ['order', 'created_at', 'taken_at', 'camera_make', 'camera_model', 'lens_model', 'focal_length', 'iso']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('order', 'created_at', 'id')
+
+    # Query parameter -> lookup, applied when the parameter is present
+    METADATA_FILTERS = {
+        'album': 'album_id',
+        'camera_make': 'camera_make__iexact',
+        'camera_model': 'camera_model__iexact',
+        'lens_model': 'lens_model__iexact',
+        'taken_after': 'taken_at__gte',
+        'taken_before': 'taken_at__lt',
+        'iso_min': 'iso__gte',
+        'iso_max': 'iso__lte',
+        'focal_length_min': 'focal_length__gte',
+        'focal_length_max': 'focal_length__lte',
+    }
 
     def get_queryset(self):
-        return Photo.objects.filter(album__owner=self.request.user)
+        photos = with_favorited(Photo.objects.filter(album__owner=self.request.user), self.request.user).prefetch_related('renditions')
+        if self.action != 'list':
+            return photos
+
+        params = self.request.query_params
+        filters = {lookup: params[param] for param, lookup in self.METADATA_FILTERS.items() if params.get(param)}
+        for lookup in ('taken_at__gte', 'taken_at__lt'):
+            if lookup in filters:
+                # Accepts dates as well and makes naive values timezone-aware
+                filters[lookup] = serializers.DateTimeField().to_internal_value(filters[lookup])
+        if params.get('has_location') in ('true', 'false'):
+            filters['latitude__isnull'] = params['has_location'] == 'false'
+        try:
+            # Evaluating the lookups validates the values
+            return photos.filter(**filters)
+        except (ValueError, ValidationError) as e:
+            raise ParseError(f'Invalid filter: {e}')
+
+    def get_keyset_ordering(self):
+        # Pages follow ?ordering= when given, with the id breaking ties
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering.lstrip('-') in self.ordering_fields:
+            return (ordering, '-id' if ordering.startswith('-') else 'id')
+        return self.keyset_ordering
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        album_id = str(self.request.data.get('album', ''))
+        album = Album.objects.filter(pk=album_id, owner=self.request.user).first() if album_id.isdigit() else None
+        if album is None:
+            raise serializers.ValidationError({'album': 'One of your albums is required'})
+        with transaction.atomic():
+            # Appended after the album's last photo, like uploads (api/ingest.py)
+            photo = serializer.save(owner=self.request.user, album=album, order=append_order(album))
+        enqueue('process_photo', {'photo_id': photo.pk})
 
 class AlbumViewSet(viewsets.ModelViewSet):
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', 'id')
 
     def get_queryset(self):
-        return Album.objects.filter(owner=self.request.user)
+        # Photo count and cover are stored on the album (api/aggregates.py)
+        albums = Album.objects.filter(owner=self.request.user).select_related('cover_photo')
+        if self.action == 'list':
+            return self.filter_by_tags(albums).prefetch_related('tags', 'cover_photo__renditions')
+        photos = with_favorited(Photo.objects.all(), self.request.user).prefetch_related('renditions')
+        return albums.prefetch_related(Prefetch('photos', queryset=photos), 'cover_photo__renditions', 'tags', 'access_links')
+
+    def filter_by_tags(self, albums):
+        # ?tags=wedding,2024 with tag_mode=any (default) or all
+        names = [name.strip() for name in self.request.query_params.get('tags', '').split(',') if name.strip()]
+        mode = self.request.query_params.get('tag_mode', TAG_MODE_ANY)
+        if mode not in TAG_MODES:
+            raise ParseError(f"tag_mode must be one of {', '.join(TAG_MODES)}")
+        if not names:
+            return albums
+        return filter_albums_by_tags(albums, self.request.user, names, mode)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AlbumListSerializer
+        return AlbumSerializer
+
+    def list(self, request, *args, **kwargs):
+        # A fixed number of queries however many albums there are: albums with
+        # their cover photos, tags, cover renditions, access links and
+        # selection counts
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        albums = list(queryset if page is None else page)
+        context = {**self.get_serializer_context(), 'selection_counts': self.selection_counts(albums)}
+        serializer = self.get_serializer(albums, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def selection_counts(self, albums):
+        """{album id: {client name: selected photo count}} for the albums"""
+        links = AccessLink.objects.filter(album__in=albums).values_list('pk', 'album_id', 'client_name')
+        link_info = {pk: (album_id, client_name) for pk, album_id, client_name in links}
+        counts = (
+            ClientSelection.objects.filter(access_link_id__in=link_info)
+            .values('access_link_id').annotate(count=Count('pk')).values_list('access_link_id', 'count')
+        )
+        result = {}
+        for link_id, (album_id, client_name) in link_info.items():
+            result.setdefault(album_id, {})[client_name] = 0
+        for link_id, count in counts:
+            album_id, client_name = link_info[link_id]
+            result[album_id][client_name] = count
+        return result
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
     
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
-    
+
+    @action(detail=True, methods=['get'])
+    def processing(self, request, pk=None):
+        """Per-photo post-upload processing state, for polling after an upload"""
+        album = get_object_or_404(Album, pk=pk, owner=request.user)
+        photos = list(album.photos.order_by().values('id', 'processing_status'))
+
+        counts = {status_value: 0 for status_value, _ in Photo.PROCESSING_CHOICES}
+        for photo in photos:
+            counts[photo['processing_status']] += 1
+
+        return Response({
+            'complete': counts[Photo.PROCESSING_PENDING] == counts[Photo.PROCESSING_RUNNING] == 0,
+            'counts': counts,
+            'photos': photos,
+        })
+
+    @action(detail=True, methods=['get'])
+    def duplicates(self, request, pk=None):
+        """Groups of near-identical photos, for culling bursts; ?distance= sets how near (in bits)"""
+        album = get_object_or_404(Album, pk=pk, owner=request.user)
+        try:
+            distance = int(request.query_params.get('distance', DEFAULT_DUPLICATE_DISTANCE))
+        except ValueError:
+            return Response({'error': 'Invalid distance'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= distance <= MAX_DUPLICATE_DISTANCE:
+            return Response({'error': f'Distance must be between 0 and {MAX_DUPLICATE_DISTANCE}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hashes = album.photos.filter(phash__isnull=False).order_by('order', 'created_at', 'id').values_list('id', 'phash')
+        return Response({
+            'distance': distance,
+            'clusters': duplicate_clusters(hashes, distance),
+        })
+
 class AlbumUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -236,14 +391,94 @@ class AlbumUploadView(APIView):
         album = get_object_or_404(Album, pk=pk)
         images = request.FILES.getlist('images')
 
-        photos = []
-        for image in images:
-            photo = Photo.objects.create(album=album, image=image, owner=request.user, title=image.name)
-            photos.append(photo)
+        # One transaction and one INSERT for the whole batch; renditions etc.
+        # are built by the job worker so the upload returns right away
+        try:
+            photos = ingest_photos(album, request.user, images)
+        except IngestError as e:
+            return Response({'error': str(e), 'files': e.failures}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = PhotoSerializer(photos, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+class UploadSessionView(APIView):
+    """Start a resumable chunked upload into an album"""
+    permission_classes = [IsAuthenticated]
+    # Every chunk is a request, so uploads get their own, larger budget
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'uploads'
+
+    def post(self, request):
+        album = get_object_or_404(Album, pk=request.data.get('album'), owner=request.user)
+        filename = request.data.get('filename')
+        if not filename:
+            return Response({'error': 'Filename is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = create_session(
+                request.user,
+                album,
+                filename,
+                int(request.data.get('size', 0)),
+                int(request.data.get('chunk_size') or 0) or None,
+                request.data.get('sha256', ''),
+            )
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid size'}, status=status.HTTP_400_BAD_REQUEST)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+
+        return Response(progress(session), status=status.HTTP_201_CREATED)
+
+class UploadSessionDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'uploads'
+
+    def get(self, request, session_id):
+        session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+        return Response(progress(session))
+
+    def delete(self, request, session_id):
+        session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+        delete_session(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadChunkView(APIView):
+    """PUT one chunk as the raw request body, with its SHA-256 in X-Chunk-SHA256"""
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'uploads'
+
+    def put(self, request, session_id, index):
+        session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+        checksum = request.headers.get('X-Chunk-SHA256', '')
+        if not checksum:
+            return Response({'error': 'X-Chunk-SHA256 header is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Read the body as a stream rather than through request.data
+            write_chunk(session, index, request.stream, checksum)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+
+        return Response({'index': index, 'offset': index * session.chunk_size, 'size': session.chunk_length(index)})
+
+class UploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'uploads'
+
+    def post(self, request, session_id):
+        session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+        try:
+            photo = complete_session(session)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+
+        serializer = PhotoSerializer(photo, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_csrf_token(request):
@@ -275,11 +510,15 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
 class AlbumTagViewSet(viewsets.ModelViewSet):
-    serializer_class = AlbumTagSerializer
+    serializer_class = AlbumTagCountSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return AlbumTag.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        # Album counts per tag, cached per user (api/tags.py)
+        return {**super().get_serializer_context(), 'tag_counts': tag_counts(self.request.user)}
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -287,15 +526,96 @@ class AlbumTagViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_favorites(request):
-    favorites = Favorite.objects.filter(user=request.user)
-    photos = [favorite.photo for favorite in favorites]
+    # Two queries per page whatever its size: the keyset page of
+    # favorites joined to their photos, and the photos' renditions
+    favorites = Favorite.objects.filter(user=request.user).select_related('photo').prefetch_related('photo__renditions')
+    paginator = KeysetPagination()
+    paginator.ordering = ('-created_at', 'id')
+    page = paginator.paginate_queryset(favorites, request)
+
+    photos = []
+    for favorite in (favorites if page is None else page):
+        favorite.photo.is_favorited = True
+        photos.append(favorite.photo)
     serializer = PhotoSerializer(photos, many=True)
+    if page is not None:
+        return paginator.get_paginated_response(serializer.data)
     return Response(serializer.data)
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """
+    Ranked full-text search over the user's albums, photos and tags:
+    ``?q=smith wedding`` with optional ``type=album,photo,tag`` and ``limit``.
+    """
+    kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+    if any(kind not in SEARCH_KINDS for kind in kinds):
+        raise ParseError(f"type must be a comma-separated list of {', '.join(SEARCH_KINDS)}")
+    try:
+        limit = int(request.query_params.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        raise ParseError('limit must be a number')
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    hits = search_index(request.user, request.query_params.get('q', ''), kinds or None, limit)
+
+    # The matched rows themselves, three queries at most; hits for rows that
+    # are gone or no longer the user's are dropped
+    ids = {kind: [object_id for hit_kind, object_id, _, _ in hits if hit_kind == kind] for kind in SEARCH_KINDS}
+    albums = Album.objects.filter(owner=request.user, pk__in=ids['album']).select_related('cover_photo').in_bulk()
+    photos = Photo.objects.filter(album__owner=request.user, pk__in=ids['photo']).prefetch_related('renditions').in_bulk()
+    tags = AlbumTag.objects.filter(user=request.user, pk__in=ids['tag']).in_bulk()
+
+    results = []
+    for kind, object_id, album_id, snippet in hits:
+        result = {'type': kind, 'id': object_id, 'album_id': album_id, 'snippet': snippet}
+        if kind == 'album' and object_id in albums:
+            album = albums[object_id]
+            cover = album.cover_photo
+            result.update(title=album.title, photo_count=album.photo_count, cover_placeholder=cover.placeholder if cover else '')
+        elif kind == 'photo' and object_id in photos:
+            photo = photos[object_id]
+            result.update(title=photo.title, placeholder=photo.placeholder, renditions=rendition_map(photo, request))
+        elif kind == 'tag' and object_id in tags:
+            result.update(title=tags[object_id].name)
+        else:
+            continue
+        results.append(result)
+    return Response({'query': request.query_params.get('q', ''), 'results': results})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_favorites(request):
+    """Add and remove several favorites in one request: ``{"add": [ids], "remove": [ids]}``"""
+    serializer = FavoriteBulkSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    add, remove = serializer.validated_data['add'], serializer.validated_data['remove']
+
+    requested = add | remove
+    found = set(Photo.objects.filter(pk__in=requested, album__owner=request.user).values_list('pk', flat=True))
+    if found != requested:
+        return Response({'error': 'Photos not found', 'photo_ids': sorted(requested - found)},
+                        status=status.HTTP_404_NOT_FOUND)
+
+    with transaction.atomic():
+        # Photos that are already favorites are skipped by the unique constraint
+        Favorite.objects.bulk_create(
+            [Favorite(user=request.user, photo_id=photo_id) for photo_id in add], ignore_conflicts=True
+        )
+        Favorite.objects.filter(user=request.user, photo_id__in=remove).delete()
+
+    # The requested photos that are favorites now
+    favorited = Favorite.objects.filter(user=request.user, photo_id__in=requested).values_list('photo_id', flat=True)
+    return Response({'favorited': sorted(favorited)})
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_favorite(request, photo_id):
-    photo = get_object_or_404(Photo, id=photo_id)
+    photo = get_object_or_404(Photo, id=photo_id, album__owner=request.user)
     favorite, created = Favorite.objects.get_or_create(user=request.user, photo=photo)
     
     if not created:
@@ -315,9 +635,15 @@ def update_avatar(request):
     avatar = request.FILES.get('avatar')  # Get the uploaded avatar file
 
     if avatar:
-        user_profile.avatar = avatar  # Update the avatar field
-        user_profile.save()  # Save the profile
-        return Response({'message': 'Avatar updated successfully.'})
+        try:
+            # Stores the avatar and its fixed-size square variants
+            set_avatar(user_profile, avatar)
+        except AvatarError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({
+            'message': 'Avatar updated successfully.',
+            'avatar_variants': avatar_urls(user_profile),
+        })
 
     return Response({'error': 'No avatar provided.'}, status=400)
 
@@ -635,7 +961,12 @@ class ClientAlbumAccessView(ClientBaseView):
             return Response({"error": "Invalid or expired token"}, status=403)
 
         access_link = token_obj.access_link
-        serializer = AlbumSerializer(access_link.album, context={"request": request})
+        album = (
+            Album.objects.select_related('cover_photo')
+            .prefetch_related('photos__renditions', 'cover_photo__renditions', 'access_links')
+            .get(pk=access_link.album_id)
+        )
+        serializer = AlbumSerializer(album, context={"request": request})
 
         # selected_photo_ids = list(
         #     ClientSelection.objects
@@ -661,7 +992,7 @@ class ClientGetSelectionsView(ClientBaseView):
         data = [
             {
                 'id': sel.id,
-                'photo_id': sel.photo.id,
+                'photo_id': sel.photo_id,
                 'selected_at': sel.created_at
             } for sel in selections
         ]
@@ -699,6 +1030,14 @@ class ClientSelectPhotoView(ClientBaseView):
             return JsonResponse({'error': 'Selection not found'}, status=404)
 
 
+def zip_response(photos, filename):
+    # Streamed so memory use stays flat and the first bytes go out immediately,
+    # however large the album is
+    response = StreamingHttpResponse(iter_zip(archive_entries(photos)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
 class ClientDownloadSelectedView(ClientBaseView):
     def post(self, request, token):
         access_link = request.auth.access_link
@@ -710,19 +1049,13 @@ class ClientDownloadSelectedView(ClientBaseView):
         if not photo_ids:
             return JsonResponse({'error': 'No photos selected'}, status=400)
 
-        selections = ClientSelection.objects.filter(access_link=access_link, photo__id__in=photo_ids)
-        if not selections.exists():
+        # Selections may be in another database than photos, so no join
+        selected = ClientSelection.objects.filter(access_link=access_link, photo_id__in=photo_ids).values_list('photo_id', flat=True)
+        photos = list(Photo.objects.filter(pk__in=list(selected), album_id=access_link.album_id))
+        if not photos:
             return JsonResponse({'error': 'No valid selections found'}, status=404)
 
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for sel in selections:
-                path = sel.photo.image.path
-                name = f"{sel.photo.id}_{os.path.basename(path)}"
-                zip_file.write(path, name)
-
-        zip_buffer.seek(0)
-        return FileResponse(zip_buffer, as_attachment=True, filename=f"{access_link.album.title}_selected.zip")
+        return zip_response(photos, f"{access_link.album.title}_selected.zip")
 
 
 class ClientDownloadAllView(ClientBaseView):
@@ -732,16 +1065,71 @@ class ClientDownloadAllView(ClientBaseView):
         if not access_link.can_download:
             return JsonResponse({'error': 'Downloads not allowed'}, status=403)
 
-        photos = Photo.objects.filter(album=access_link.album)
-        if not photos.exists():
+        photos = album_photos(access_link.album_id)
+        if not photos:
             return JsonResponse({'error': 'No photos found'}, status=404)
 
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for photo in photos:
-                path = photo.image.path
-                name = f"{photo.id}_{os.path.basename(path)}"
-                zip_file.write(path, name)
+        filename = f"{access_link.album.title}_all_photos.zip"
+        cached = get_cached_archive(access_link.album_id, photos)
+        if cached:
+            # Supports Range, so an interrupted download can be resumed
+            return serve_file(request, cached, filename=filename, cache_control='private, no-cache')
+
+        # Stream this one and build the cached copy for the next download
+        queue_album_archive(access_link.album_id, photos)
+        return zip_response(photos, filename)
+
+
+
+class MediaNegotiation(BaseContentNegotiation):
+    """
+    Media responses are files, not rendered data; the Accept header picks the
+    image format instead (see MediaView), so it must not cause a 406 here.
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+class MediaView(APIView):
+    """
+    Serves files under MEDIA_ROOT to the owner (JWT), to clients with an
+    access token for the photo's album, or to anyone holding a signed URL.
+    """
+    authentication_classes = [MediaAccessAuthentication]
+    permission_classes = [AllowAny]
+    throttle_classes = []
+    content_negotiation_class = MediaNegotiation
+
+    def get(self, request, path):
+        name = posixpath.normpath(path).lstrip('/')
+        if name.startswith('..') or not self.has_access(request, name):
+            # 404 rather than 403 so the existence of other users' files isn't revealed
+            raise Http404('File not found')
+
+        variants = rendition_variants(name)
+        if variants:
+            requested = request.GET.get('image_format')
+            if requested != 'jpeg' and requested not in variants:
+                requested = negotiate_format(request.META.get('HTTP_ACCEPT', ''), variants)
+            name = variants.get(requested, name)
+
+        try:
+            file_path = default_storage.path(name)
+        except SuspiciousFileOperation:
+            raise Http404('File not found')
+        response = serve_file(request, file_path)
+        if variants:
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+    def has_access(self, request, name):
+        if has_valid_signature(name, request.GET.get('expires'), request.GET.get('sig')):
+            return True
 
-        zip_buffer.seek(0)
-        return FileResponse(zip_buffer, as_attachment=True, filename=f"{access_link.album.title}_all_photos.zip")
+        if request.user and request.user.is_authenticated:
+            return can_access_media(name, user=request.user)
+        if isinstance(request.auth, ClientAccessToken):
+            return can_access_media(name, album_id=request.auth.access_link.album_id)
+        return False
@@ -0,0 +1,72 @@
+"""
+Streaming ZIP archives.
+
+zipfile can write to a stream it cannot seek in: it then emits a data
+descriptor after each member instead of patching the local header. We give it
+a sink that just collects written bytes and drain that sink after every read
+chunk, so only one chunk of the archive is held in memory at a time.
+"""
+import os
+import zipfile
+from datetime import datetime
+
+CHUNK_SIZE = 64 * 1024
+
+# Formats that are already compressed; deflating them only burns CPU
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.heic', '.mp4', '.mov', '.zip'}
+
+
+class _Sink:
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compression_for(name):
+    extension = os.path.splitext(name)[1].lower()
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _zip_info(arcname, path):
+    stat = os.stat(path)
+    info = zipfile.ZipInfo(arcname, date_time=datetime.fromtimestamp(stat.st_mtime).timetuple()[:6])
+    info.compress_type = compression_for(arcname)
+    # Lets zipfile decide up front whether the member needs ZIP64 extras
+    info.file_size = stat.st_size
+    return info
+
+
+def iter_zip(files):
+    """Yield a ZIP archive of ``(arcname, path)`` pairs as a stream of bytes."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zip_file:
+        for arcname, path in files:
+            with open(path, 'rb') as source, zip_file.open(_zip_info(arcname, path), 'w') as member:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+    # Last data descriptor plus the central directory
+    data = sink.drain()
+    if data:
+        yield data
@@ -100,13 +100,64 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite set up for several worker processes writing at once:
+# - WAL lets readers carry on while one connection writes
+# - busy_timeout makes a writer wait for the lock instead of failing with
+#   "database is locked"
+# - BEGIN IMMEDIATE takes the write lock when a transaction starts; a
+#   deferred transaction that reads first cannot wait for it later and fails
+#   at once when another process is writing
+# - synchronous=NORMAL is durable in WAL mode except across power loss
+# The pragmas run on every new connection; persistent connections
+# (CONN_MAX_AGE) avoid paying for that on each request.
+# `manage.py sqlite_stress` checks the setup with concurrent writer processes.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # milliseconds
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # negative: KiB rather than pages
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
     }
 }
 
+# Optional separate SQLite file for login attempts, client access tokens and
+# client selections (api/routers.py), whose frequent small writes would
+# otherwise queue behind photo and album writes. After setting it, run
+# `manage.py migrate --database=telemetry` and `manage.py copy_telemetry`.
+TELEMETRY_SQLITE_PATH = os.getenv('TELEMETRY_SQLITE_PATH')
+if TELEMETRY_SQLITE_PATH:
+    DATABASES['telemetry'] = {**DATABASES['default'], 'NAME': TELEMETRY_SQLITE_PATH}
+
+DATABASE_ROUTERS = ['api.routers.TelemetryRouter']
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-user album counts per tag (api/tags.py). On disk so that every
+    # worker process sees another's invalidation.
+    'tag_counts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('TAG_COUNTS_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'tag_counts')),
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -166,7 +217,8 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
-        'user': '1000/day'
+        'user': '1000/day',
+        'uploads': '50000/day',
     }
 }
 
@@ -181,6 +233,68 @@ SIMPLE_JWT = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Media is served by api.views.MediaView; URLs from MediaStorage are signed
+# and stay valid (and identical, so browsers can cache them) for at least
+# MEDIA_URL_SIGNATURE_MAX_AGE seconds.
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.MediaStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+MEDIA_URL_SIGNATURE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Directory layout of photo originals (api/storage.py), e.g.
+# photos/<owner id>/ab/cd/abcd....jpg. Identical files are only shared within
+# a directory, so per-owner sharding also keeps each user's files separate.
+# After changing this, move existing files with `manage.py migrate_media_layout`.
+MEDIA_LAYOUT = {
+    'SHARD_BY_OWNER': True,
+    'HASH_PREFIX_DEPTH': 2,  # levels of two-hex-digit directories
+}
+MEDIA_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Prebuilt full-album downloads (api/archives.py)
+ALBUM_ARCHIVE_CACHE = {
+    'DIR': os.path.join(BASE_DIR, 'archive_cache'),
+    'MAX_BYTES': int(os.getenv('ALBUM_ARCHIVE_CACHE_MAX_BYTES', str(20 * 1024 ** 3))),
+}
+
+# How api.media.serve_file sends file bodies: 'direct' streams them from
+# Django, 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) let
+# the front proxy send them after Django has authorized the request. For
+# nginx, each directory maps to an internal location, e.g.
+#   location /protected/media/ { internal; alias /srv/app/media/; }
+FILE_SERVING = {
+    'BACKEND': os.getenv('FILE_SERVING_BACKEND', 'direct'),
+    'X_ACCEL_LOCATIONS': {
+        MEDIA_ROOT: '/protected/media/',
+        ALBUM_ARCHIVE_CACHE['DIR']: '/protected/archives/',
+    },
+}
+
+# Resumable chunked uploads (api/uploads.py)
+UPLOAD_SESSIONS = {
+    'DIR': os.path.join(BASE_DIR, 'upload_sessions'),
+    'CHUNK_SIZE': 8 * 1024 * 1024,
+    'MAX_CHUNK_SIZE': 32 * 1024 * 1024,
+    'MAX_FILE_SIZE': 500 * 1024 * 1024,
+    'EXPIRE_AFTER': 24 * 60 * 60,  # seconds without activity before cleanup_upload_sessions removes a session
+}
+
+# Background jobs (api/jobs.py), processed by `manage.py run_worker`.
+# Set JOB_QUEUE_EAGER=True to run jobs in-process when no worker is running.
+JOB_QUEUE = {
+    'EAGER': os.getenv('JOB_QUEUE_EAGER', 'False') == 'True',
+    'PROCESSES': int(os.getenv('JOB_QUEUE_PROCESSES', '2')),
+    'VISIBILITY_TIMEOUT': 600,  # seconds before a running job may be reclaimed
+    'POLL_INTERVAL': 2,  # seconds between polls when the queue is empty
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,  # seconds, doubled after each failed attempt
+}
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 # from rest_framework.routers import DefaultRouter
@@ -35,4 +34,6 @@ urlpatterns = [
     path('api/albums/<int:pk>/upload/', AlbumUploadView.as_view(), name='album-upload'),
 
     path('api/current_user/', current_user, name='current_user'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", views.MediaView.as_view(), name='media'),
+]
@@ -20,6 +20,7 @@ const AlbumCard = ({ album }) => {
                         src={`http://localhost:8000${album.cover_photo}`}
                         alt={`Cover of ${album.title}`}
                         className="rounded-t-lg object-cover h-48 w-full"
+                        style={album.cover_placeholder ? { backgroundImage: `url(${album.cover_placeholder})`, backgroundSize: 'cover' } : undefined}
                     />
                 ) : (
                     <div className="w-full h-48 bg-gray-300 flex justify-center items-center">
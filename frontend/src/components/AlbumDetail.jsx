@@ -3,6 +3,7 @@ import { useParams, useNavigate } from 'react-router-dom';
 import { useDropzone } from "react-dropzone";
 import PhotoCard from './PhotoCard';
 import PhotoListItem from './PhotoListItem';
+import DraggablePhotoList from './DraggablePhotoList';
 import AlbumTagManager from './AlbumTagManager';
 import { useAuth } from '../contexts/AuthContext';
 import api from '../api/axios';
@@ -213,7 +214,13 @@ const AlbumDetail = () => {
       setError(null);
     } catch (error) {
       console.error("Error uploading photos:", error);
-      setError("Failed to upload photos. Please try again.");
+      const rejected = error.response?.data?.files;
+      if (rejected) {
+        // The batch is refused as a whole when any file isn't an image
+        setError(`Not images: ${rejected.map((failure) => failure.file).join(', ')}. Nothing was uploaded.`);
+      } else {
+        setError("Failed to upload photos. Please try again.");
+      }
     }
   };
 
@@ -222,6 +229,23 @@ const AlbumDetail = () => {
     accept: "image/*",
   });
 
+  const handlePhotosReordered = (reorderedPhotos, version) => {
+    setPhotos(reorderedPhotos);
+    setAlbum(prev => ({ ...prev, order_version: version }));
+  };
+
+  const handleReorderConflict = async () => {
+    // Reordered in another tab: take its order and version, then let the user retry
+    try {
+      const response = await api.get(`/api/albums/${albumId}/`);
+      setAlbum(response.data);
+      setPhotos(response.data.photos);
+      setError('The photos were reordered elsewhere and have been reloaded. Please try again.');
+    } catch (err) {
+      console.error('Error reloading album:', err);
+    }
+  };
+
   const handleDeletePhoto = async (photoId) => {
     setPhotoToDelete(photoId);
   };
@@ -493,6 +517,17 @@ const AlbumDetail = () => {
                 <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M4 6h16M4 12h16M4 18h16" />
               </svg>
             </button>
+            <button
+              onClick={() => setViewMode('reorder')}
+              title="Reorder photos"
+              className={`p-2 rounded-lg transition-colors duration-200 ${
+                viewMode === 'reorder' ? 'bg-gray-100 text-gray-900' : 'text-gray-500 hover:bg-gray-100'
+              }`}
+            >
+              <svg className="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M7 16V4m0 0L3 8m4-4l4 4m6 0v12m0 0l4-4m-4 4l-4-4" />
+              </svg>
+            </button>
           </div>
         </div>
 
@@ -506,6 +541,16 @@ const AlbumDetail = () => {
           <div className="text-center text-gray-500">
             No photos in this album yet.
           </div>
+        ) : viewMode === 'reorder' ? (
+          // The whole album, not the client filter: moves are sent with the
+          // photo's real neighbours and the album's order_version
+          <DraggablePhotoList
+            photos={photos}
+            albumId={albumId}
+            orderVersion={album.order_version}
+            onPhotosUpdate={handlePhotosReordered}
+            onConflict={handleReorderConflict}
+          />
         ) : (
           <div className={`transition-all duration-300 ${
             viewMode === 'grid' 
@@ -15,7 +15,7 @@ const Dashboard = ( sidebarOpen ) => {
   useEffect(() => {
     const fetchAlbums = async () => {
       try {
-        const response = await axios.get('/api/albums/');
+        const response = await axios.get('/api/albums/?paginate=false');
         setAlbums(response.data);
         setError(null);
       } catch (err) {
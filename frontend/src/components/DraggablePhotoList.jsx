@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import { DragDropContext, Droppable, Draggable } from 'react-beautiful-dnd';
 import api from '../utils/axiosConfig';
 
-const DraggablePhotoList = ({ photos, albumId, onPhotosUpdate }) => {
+const DraggablePhotoList = ({ photos, albumId, orderVersion, onPhotosUpdate, onConflict }) => {
   const [isReordering, setIsReordering] = useState(false);
 
   const handleDragEnd = async (result) => {
@@ -12,20 +12,28 @@ const DraggablePhotoList = ({ photos, albumId, onPhotosUpdate }) => {
     const [reorderedItem] = items.splice(result.source.index, 1);
     items.splice(result.destination.index, 0, reorderedItem);
 
-    // Update the order of all photos
-    const photoOrders = items.map((photo, index) => ({
-      id: photo.id,
-      order: index,
-    }));
+    // Only the moved photo is sent, with its new neighbours
+    const index = result.destination.index;
+    const move = {
+      photo: reorderedItem.id,
+      after: index > 0 ? items[index - 1].id : null,
+      before: index < items.length - 1 ? items[index + 1].id : null,
+    };
 
     try {
       setIsReordering(true);
-      await api.post(`/api/albums/${albumId}/reorder-photos/`, {
-        photo_orders: photoOrders,
+      const response = await api.post(`/api/albums/${albumId}/reorder-photos/`, {
+        move,
+        version: orderVersion,
       });
-      onPhotosUpdate(items);
+      onPhotosUpdate(items, response.data.version);
     } catch (error) {
-      console.error('Error reordering photos:', error);
+      if (error.response?.status === 409 && onConflict) {
+        // The album was reordered in another tab; reload before retrying
+        onConflict(error.response.data.version);
+      } else {
+        console.error('Error reordering photos:', error);
+      }
     } finally {
       setIsReordering(false);
     }
@@ -23,18 +23,8 @@ const PhotoCard = ({ photo, onDelete, isDragging }) => {
   }, []);
 
   useEffect(() => {
-    const checkFavoriteStatus = async () => {
-      try {
-        const response = await api.get(`/api/favorites/`);
-        const isFavorited = response.data.some(favorite => favorite.id === photo.id);
-        setIsFavorited(isFavorited);
-      } catch (error) {
-        console.error('Error checking favorite status:', error);
-      }
-    };
-
-    checkFavoriteStatus();
-  }, [photo.id]);
+    setIsFavorited(Boolean(photo.is_favorited));
+  }, [photo.id, photo.is_favorited]);
 
   const getImageUrl = (image) => {
     if (!image) return '';
@@ -99,6 +89,7 @@ const PhotoCard = ({ photo, onDelete, isDragging }) => {
             src={getImageUrl(photo.image)}
             alt={photo.title || 'Photo'}
             className="w-full h-full object-cover"
+            style={photo.placeholder ? { backgroundImage: `url(${photo.placeholder})`, backgroundSize: 'cover' } : undefined}
           />
           <div className="absolute top-2 right-2" ref={dropdownRef}>
             <button
@@ -23,18 +23,8 @@ const PhotoListItem = ({ photo, onDelete, isDragging }) => {
   }, []);
 
   useEffect(() => {
-    const checkFavoriteStatus = async () => {
-      try {
-        const response = await api.get(`/api/favorites/`);
-        const isFavorited = response.data.some(favorite => favorite.id === photo.id);
-        setIsFavorited(isFavorited);
-      } catch (error) {
-        console.error('Error checking favorite status:', error);
-      }
-    };
-
-    checkFavoriteStatus();
-  }, [photo.id]);
+    setIsFavorited(Boolean(photo.is_favorited));
+  }, [photo.id, photo.is_favorited]);
 
   const getImageUrl = (image) => {
     if (!image) return '';
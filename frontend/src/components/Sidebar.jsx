@@ -41,7 +41,8 @@ const Sidebar = ({ username, onLogout, userData, onUserDataUpdate, sidebarOpen,
 
     // Define the base URL for media files
   const baseUrl = 'http://localhost:8000'; // Adjust this to your actual base URL
-  const avatarUrl = userData?.avatar ? `${baseUrl}${userData.avatar}` : defaultAvatar; // Construct the full URL
+  const avatarPath = userData?.avatar_variants?.small || userData?.avatar; // Prefer the resized square variant
+  const avatarUrl = avatarPath ? `${baseUrl}${avatarPath}` : defaultAvatar; // Construct the full URL
 
   if (!userData) {
     return <LoadingSpinner />;
@@ -54,7 +54,7 @@ const UserProfile = ({ onUserDataUpdate, successMessage, setSuccessMessage }) =>
         onUserDataUpdate(response.data);
 
       // Update the user data immediately in the local state
-      const updatedUserData = { ...userData, avatar: response.data.avatar }; // Assuming response.data.avatar contains the new avatar URL
+      const updatedUserData = { ...userData, avatar: response.data.avatar, avatar_variants: response.data.avatar_variants }; // Assuming response.data.avatar contains the new avatar URL
       setUserData(updatedUserData); // Update local state
       setAvatar(null); // Reset avatar state after upload
       fileInputRef.current.value = null; // Reset the file input value
@@ -83,7 +83,8 @@ const UserProfile = ({ onUserDataUpdate, successMessage, setSuccessMessage }) =>
 
   // Define the base URL for media files
   const baseUrl = 'http://localhost:8000'; // Adjust this to your actual base URL
-  const avatarUrl = userData.avatar ? `${baseUrl}${userData.avatar}` : defaultAvatar; // Construct the full URL
+  const avatarPath = userData.avatar_variants?.large || userData.avatar; // Prefer the resized square variant
+  const avatarUrl = avatarPath ? `${baseUrl}${avatarPath}` : defaultAvatar; // Construct the full URL
 
   return (
     <div className="max-w-lg mx-auto mt-10 bg-white shadow-md rounded-lg p-6 mb-8">
@@ -303,6 +303,7 @@ export default function ClientAccessPage() {
           src={photo.image}
           alt={photo.title || "Photo"}
           className="w-full h-full object-cover"
+          style={photo.placeholder ? { backgroundImage: `url(${photo.placeholder})`, backgroundSize: 'cover' } : undefined}
         />
         <div className="absolute inset-0 bg-gradient-to-t from-black/60 via-transparent to-transparent opacity-0 group-hover:opacity-100 transition-opacity duration-300"></div>
         
@@ -347,6 +348,7 @@ export default function ClientAccessPage() {
           src={photo.image}
           alt={photo.title || "Photo"}
           className="w-full h-full object-cover"
+          style={photo.placeholder ? { backgroundImage: `url(${photo.placeholder})`, backgroundSize: 'cover' } : undefined}
         />
       </div>
       <div className="flex-grow">